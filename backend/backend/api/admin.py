@@ -2,8 +2,10 @@ from django.contrib import admin
 from django.contrib.auth.models import Group
 
 from .models import (
-    Favorite, Ingredient, ShoppingCart, Recipe, RecipeIngredient, Tag
+    Favorite, Ingredient, ShoppingCart, ShoppingListItem, Recipe,
+    RecipeIngredient, Tag
 )
+from .shopping_list import track_recipe_ingredients
 
 
 class IngredientInLine(admin.TabularInline):
@@ -14,10 +16,18 @@ class IngredientInLine(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     inlines = [IngredientInLine, ]
-    list_display = ('name', 'author', 'get_ingredients', 'get_favorite_count')
+    list_display = (
+        'name', 'author', 'get_ingredients', 'get_favorite_count',
+        'in_carts_count'
+    )
     list_filter = ('name', 'author', 'tags')
     search_fields = ('name', 'author', 'tags')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related('ingredients')
+
     def get_ingredients(self, obj):
         return (
             ', '.join(
@@ -26,9 +36,14 @@ class RecipeAdmin(admin.ModelAdmin):
         )
 
     def get_favorite_count(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        with track_recipe_ingredients(form.instance):
+            super().save_related(request, form, formsets, change)
 
     get_favorite_count.short_description = 'Количество избранных'
+    get_favorite_count.admin_order_field = 'favorites_count'
     get_ingredients.short_description = 'Ингредиенты'
 
 
@@ -45,4 +60,5 @@ admin.site.register(Tag)
 admin.site.register(RecipeIngredient)
 admin.site.register(ShoppingCart)
 admin.site.register(Favorite)
+admin.site.register(ShoppingListItem)
 admin.site.unregister(Group)
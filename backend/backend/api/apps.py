@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .indexes import create_postgresql_indexes, create_sqlite_tables
+        from .utils import register_fonts
+        register_fonts()
+        post_migrate.connect(create_postgresql_indexes, sender=self)
+        post_migrate.connect(create_sqlite_tables, sender=self)
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from users.models import User
+
+
+class TokenCache:
+    """LRU-кэш токен -> снимок пользователя с ограниченным сроком жизни.
+
+    Хранятся значения полей пользователя, на каждый запрос из них
+    собирается новый объект, так что изменения request.user в одном
+    запросе не попадают в другие. Кэш живёт в памяти процесса: сигналы
+    очищают его только в том процессе, где изменился пользователь или
+    удалён токен, в остальных запись устаревает не позже чем через ttl
+    секунд.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        _, db, values, _ = entry
+        return User.from_db(db, None, values)
+
+    def set(self, key, user):
+        values = tuple(
+            getattr(user, field.attname)
+            for field in User._meta.concrete_fields
+        )
+        with self._lock:
+            self._entries[key] = (
+                user.id, user._state.db, values, time.monotonic() + self.ttl
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [
+                key for key, entry in self._entries.items()
+                if entry[0] == user_id
+            ]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / requests, 4) if requests else None,
+        }
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def get_token_cache_stats():
+    """Строка отчёта get_cache_stats для кэша токенов этого процесса."""
+    return {'name': 'tokens', 'backend': 'TokenCache', **token_cache.stats()}
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе для известных токенов.
+
+    Попадание или промах в кэш записывается в request._token_cache,
+    его сохраняет ProfilingMiddleware.
+    """
+
+    def authenticate(self, request):
+        self.cache_status = None
+        try:
+            return super().authenticate(request)
+        finally:
+            if self.cache_status is not None:
+                request._request._token_cache = self.cache_status
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is not None:
+            self.cache_status = 'hit'
+            return user, self.get_model()(key=key, user=user)
+        self.cache_status = 'miss'
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user)
+        return user, token
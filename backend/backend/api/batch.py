@@ -0,0 +1,95 @@
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Favorite, Recipe, ShoppingCart
+from .shopping_list import apply_delta, get_recipes_amounts
+from .versions import bump_versions, user_resource
+from users.models import User
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def lock_user(user_id):
+    """Не даёт параллельным пакетам дважды учесть один рецепт."""
+    list(User.objects.select_for_update().filter(id=user_id).only('id'))
+
+
+def update_related(model, user_id, recipe_ids, step):
+    """Обновляет счётчики, список покупок и версию после пакетной операции.
+
+    bulk_create и delete_rows не отправляют сигналы, поэтому то, что
+    для одиночных записей делают обработчики из signals, делается здесь.
+    """
+    counter = RECIPE_COUNTERS[model]
+    recipes = Recipe.objects.filter(id__in=recipe_ids)
+    if step < 0:
+        recipes = recipes.filter(**{f'{counter}__gt': 0})
+    recipes.update(**{counter: F(counter) + step})
+    if model is ShoppingCart:
+        apply_delta([user_id], {
+            ingredient_id: amount * step for ingredient_id, amount
+            in get_recipes_amounts(recipe_ids).items()
+        })
+    bump_versions(user_resource(user_id))
+
+
+def delete_rows(model, user_id, recipe_ids=None):
+    """Удаляет записи пользователя одним DELETE без сигналов.
+
+    queryset.delete() сначала выбирает записи и отправляет post_delete
+    для каждой, а обработчики из signals пересчитали бы счётчики и
+    список покупок по одному рецепту. Пакет обновляет их сам
+    в update_related.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    sql = f'DELETE FROM {table} WHERE user_id = %s'
+    params = [user_id]
+    if recipe_ids is not None:
+        sql += ' AND recipe_id IN ({})'.format(
+            ', '.join(['%s'] * len(recipe_ids))
+        )
+        params += recipe_ids
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def add_recipes(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или корзину, возвращает новые id."""
+    with transaction.atomic():
+        lock_user(user.id)
+        existing = set(model.objects.filter(
+            user=user, recipe__in=recipe_ids
+        ).values_list('recipe', flat=True))
+        added = [
+            recipe_id for recipe_id in recipe_ids
+            if recipe_id not in existing
+        ]
+        if added:
+            model.objects.bulk_create(
+                (model(user=user, recipe_id=recipe_id) for recipe_id in added),
+                ignore_conflicts=True
+            )
+            update_related(model, user.id, added, 1)
+    return added
+
+
+def remove_recipes(model, user, recipe_ids=None):
+    """Убирает рецепты из избранного или корзины, возвращает их id.
+
+    Без recipe_ids удаляются все записи пользователя.
+    """
+    queryset = model.objects.filter(user=user)
+    if recipe_ids is not None:
+        queryset = queryset.filter(recipe__in=recipe_ids)
+    with transaction.atomic():
+        lock_user(user.id)
+        removed = list(queryset.values_list('recipe', flat=True))
+        if removed:
+            delete_rows(
+                model, user.id, None if recipe_ids is None else removed
+            )
+            update_related(model, user.id, removed, -1)
+    return removed
@@ -0,0 +1,119 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends import db, filebased, locmem
+
+RECIPE_CACHE = 'recipes'
+SHOPPING_LIST_CACHE = 'shopping_lists'
+REFERENCE_CACHE = 'reference'
+RATE_CACHE = 'rate'
+
+STATS_KEYS = ('cache_stats:hits', 'cache_stats:misses')
+
+MISSING = object()
+
+
+class CacheStatsMixin:
+    """Считает попадания и промахи кэша.
+
+    Счётчики копятся в памяти и не реже чем раз в STATS_FLUSH_INTERVAL
+    секунд прибавляются к ключам STATS_KEYS в самом кэше, поэтому для
+    файлового кэша и кэша в базе видны суммы по всем процессам.
+    Django создаёт свой объект кэша на каждый поток, так что счётчики
+    объекта блокировок не требуют. Вложенные вызовы (get_many через
+    get и наоборот) и работа со счётчиками не считаются.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending = [0, 0]
+        self._flushed_at = time.monotonic()
+        self._in_lookup = False
+
+    def get(self, key, default=None, version=None):
+        if self._in_lookup:
+            return super().get(key, default, version)
+        self._in_lookup = True
+        try:
+            value = super().get(key, MISSING, version)
+        finally:
+            self._in_lookup = False
+        found = value is not MISSING
+        self.record(int(found), int(not found))
+        return value if found else default
+
+    def get_many(self, keys, version=None):
+        if self._in_lookup:
+            return super().get_many(keys, version)
+        keys = list(keys)
+        self._in_lookup = True
+        try:
+            values = super().get_many(keys, version)
+        finally:
+            self._in_lookup = False
+        self.record(len(values), len(keys) - len(values))
+        return values
+
+    def record(self, hits, misses):
+        self._pending[0] += hits
+        self._pending[1] += misses
+        interval = settings.CACHE_STATS_FLUSH_INTERVAL
+        if time.monotonic() - self._flushed_at >= interval:
+            self.flush_stats()
+
+    def flush_stats(self):
+        self._in_lookup = True
+        try:
+            for key, count in zip(STATS_KEYS, self._pending):
+                if count:
+                    self.add(key, 0, timeout=None)
+                    self.incr(key, count)
+        finally:
+            self._in_lookup = False
+        self._pending = [0, 0]
+        self._flushed_at = time.monotonic()
+
+    def stats(self):
+        self.flush_stats()
+        self._in_lookup = True
+        try:
+            stored = super().get_many(STATS_KEYS)
+        finally:
+            self._in_lookup = False
+        hits, misses = (stored.get(key, 0) for key in STATS_KEYS)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else None,
+        }
+
+
+class LocMemCache(CacheStatsMixin, locmem.LocMemCache):
+    pass
+
+
+class FileBasedCache(CacheStatsMixin, filebased.FileBasedCache):
+    pass
+
+
+class DatabaseCache(CacheStatsMixin, db.DatabaseCache):
+    pass
+
+
+def get_cache_stats():
+    """Попадания и промахи по каждому кэшу из CACHES.
+
+    Для сторонних бэкендов без счётчиков hits и misses равны None.
+    """
+    report = []
+    for name, config in settings.CACHES.items():
+        cache = caches[name]
+        row = {'name': name, 'backend': config['BACKEND']}
+        if isinstance(cache, CacheStatsMixin):
+            row.update(cache.stats())
+        else:
+            row.update(hits=None, misses=None, hit_rate=None)
+        report.append(row)
+    return report
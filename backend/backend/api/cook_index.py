@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import RecipeIngredient
+
+
+def to_bitset(slots, size):
+    """Битовое множество из позиций; через bytearray, а не |= по одной,
+    иначе каждое добавление копирует всё число."""
+    buffer = bytearray((size + 7) // 8)
+    for slot in slots:
+        buffer[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def count_bits(bitsets):
+    """Складывает битовые множества поразрядно.
+
+    Возвращает разряды счётчика: бит рецепта в slices[j] - j-й бит
+    числа множеств, в которые рецепт входит.
+    """
+    slices = []
+    for carry in bitsets:
+        for position, value in enumerate(slices):
+            slices[position], carry = value ^ carry, value & carry
+            if not carry:
+                break
+        if carry:
+            slices.append(carry)
+    return slices
+
+
+def equal_to(slices, count, mask):
+    """Рецепты из mask, у которых счётчик равен count."""
+    if count >> len(slices):
+        return 0
+    for position, value in enumerate(slices):
+        mask &= value if count >> position & 1 else ~value
+    return mask
+
+
+class RecipeCoverageIndex:
+    """Обратный индекс ингредиент -> рецепты для подбора по продуктам.
+
+    Каждому рецепту выдаётся позиция, для каждого ингредиента хранится
+    битовое множество позиций его рецептов (целое число Python), для
+    каждого числа ингредиентов в рецепте - множество таких рецептов.
+    Покрытие считается поразрядным сложением множеств ингредиентов
+    пользователя, без запросов к базе и без обхода рецептов по одному.
+    Строится при первом запросе, обновляется по одному рецепту
+    сигналами и перестраивается не реже чем раз в ttl секунд, как и
+    индекс ингредиентов.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._postings = None
+        self._totals = None
+        self._recipes = None
+        self._slots = None
+        self._recipe_ids = None
+        self._built_at = None
+
+    def build(self):
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+            'recipe', 'ingredient'
+        ).order_by().iterator():
+            recipes[recipe_id].add(ingredient_id)
+        recipe_ids = sorted(recipes)
+        postings = defaultdict(list)
+        totals = defaultdict(list)
+        for slot, recipe_id in enumerate(recipe_ids):
+            for ingredient_id in recipes[recipe_id]:
+                postings[ingredient_id].append(slot)
+            totals[len(recipes[recipe_id])].append(slot)
+        size = len(recipe_ids)
+        with self._lock:
+            self._postings = {
+                ingredient_id: to_bitset(slots, size)
+                for ingredient_id, slots in postings.items()
+            }
+            self._totals = {
+                total: to_bitset(slots, size)
+                for total, slots in totals.items()
+            }
+            self._recipes = {
+                recipe_id: frozenset(ingredients)
+                for recipe_id, ingredients in recipes.items()
+            }
+            self._recipe_ids = recipe_ids
+            self._slots = {
+                recipe_id: slot for slot, recipe_id in enumerate(recipe_ids)
+            }
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def is_stale(self):
+        return self._built_at is None or (
+            self.ttl is not None
+            and time.monotonic() - self._built_at > self.ttl
+        )
+
+    def _set(self, recipe_id, ingredients):
+        old = self._recipes.pop(recipe_id, frozenset())
+        slot = self._slots.get(recipe_id)
+        if slot is None:
+            if not ingredients:
+                return
+            # Новые рецепты получают позиции в конце, поэтому порядок
+            # позиций совпадает с порядком id до перестроения индекса.
+            slot = len(self._recipe_ids)
+            self._recipe_ids.append(recipe_id)
+            self._slots[recipe_id] = slot
+        bit = 1 << slot
+        for ingredient_id in old - ingredients:
+            self._postings[ingredient_id] &= ~bit
+            if not self._postings[ingredient_id]:
+                del self._postings[ingredient_id]
+        for ingredient_id in ingredients - old:
+            self._postings[ingredient_id] = (
+                self._postings.get(ingredient_id, 0) | bit
+            )
+        if old:
+            self._totals[len(old)] &= ~bit
+        if ingredients:
+            self._totals[len(ingredients)] = (
+                self._totals.get(len(ingredients), 0) | bit
+            )
+            self._recipes[recipe_id] = ingredients
+
+    def update_recipe(self, recipe_id):
+        """Перечитывает ингредиенты одного рецепта."""
+        if self._postings is None:
+            return
+        ingredients = frozenset(RecipeIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient', flat=True))
+        with self._lock:
+            self._set(recipe_id, ingredients)
+
+    def remove_recipe(self, recipe_id):
+        if self._postings is None:
+            return
+        with self._lock:
+            self._set(recipe_id, frozenset())
+
+    def match(self, ingredient_ids, limit=None, min_coverage=0):
+        """Рецепты по убыванию покрытия набором ингредиентов.
+
+        При равном покрытии выше рецепты с большим числом совпадений,
+        затем с меньшим id. Возвращает список
+        (id рецепта, покрытие, число недостающих ингредиентов).
+        """
+        if self.is_stale():
+            self.build()
+        with self._lock:
+            slices = count_bits(
+                self._postings[ingredient_id] for ingredient_id
+                in set(ingredient_ids) if ingredient_id in self._postings
+            )
+            groups = sorted(
+                (
+                    (count / total, count, total)
+                    for total in self._totals
+                    for count in range(
+                        1, min(total, 2 ** len(slices) - 1) + 1
+                    )
+                    if count / total >= min_coverage
+                ),
+                reverse=True
+            )
+            exact = {}
+            results = []
+            for coverage, count, total in groups:
+                if count not in exact:
+                    exact[count] = equal_to(slices, count, -1)
+                found = exact[count] & self._totals[total]
+                while found:
+                    lowest = found & -found
+                    results.append((
+                        self._recipe_ids[lowest.bit_length() - 1],
+                        coverage,
+                        total - count
+                    ))
+                    if limit is not None and len(results) >= limit:
+                        return results
+                    found ^= lowest
+        return results
+
+    def size(self):
+        """Число рецептов и размер битовых множеств в байтах."""
+        if self._postings is None:
+            return 0, 0
+        return len(self._recipes), sum(
+            (value.bit_length() + 7) // 8
+            for value in (*self._postings.values(), *self._totals.values())
+        )
+
+
+cook_index = RecipeCoverageIndex(ttl=settings.COOK_INDEX_TTL)
@@ -0,0 +1,86 @@
+import base64
+import binascii
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
+from rest_framework import serializers
+
+FORMAT_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+
+class Base64ImageField(serializers.ImageField):
+    """Принимает изображение в base64 и декодирует его по частям.
+
+    Байты пишутся во временный файл, а не в память; слишком большие
+    строки отклоняются до декодирования, размеры в пикселях
+    проверяются по заголовку до полной загрузки изображения.
+    """
+    chunk_size = 64 * 1024
+    default_error_messages = {
+        'invalid_base64': 'Изображение должно быть строкой base64.',
+        'too_large': 'Размер изображения больше {max_size} байт.',
+        'too_many_pixels': 'Изображение больше {max_pixels} пикселей.',
+        'invalid_image': 'Загрузите корректное изображение '
+                         '(JPEG, PNG, GIF или WebP).',
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.max_size = kwargs.pop(
+            'max_size', settings.RECIPE_IMAGE_MAX_SIZE
+        )
+        self.max_pixels = kwargs.pop(
+            'max_pixels', settings.RECIPE_IMAGE_MAX_PIXELS
+        )
+        super().__init__(*args, **kwargs)
+
+    def decode(self, encoded):
+        if len(encoded) * 3 // 4 > self.max_size:
+            self.fail('too_large', max_size=self.max_size)
+        file = tempfile.TemporaryFile()
+        try:
+            for start in range(0, len(encoded), self.chunk_size):
+                file.write(base64.b64decode(
+                    encoded[start:start + self.chunk_size], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        return file
+
+    def check_image(self, file):
+        try:
+            image = Image.open(file)
+            width, height = image.size
+            if width * height > self.max_pixels:
+                self.fail('too_many_pixels', max_pixels=self.max_pixels)
+            image.verify()
+        except serializers.ValidationError:
+            file.close()
+            raise
+        except Exception:
+            file.close()
+            self.fail('invalid_image')
+        extension = FORMAT_EXTENSIONS.get(image.format)
+        if extension is None:
+            file.close()
+            self.fail('invalid_image')
+        file.seek(0)
+        return extension
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid_base64')
+        # chunk_size кратен 4, поэтому части декодируются независимо.
+        _, _, encoded = data.rpartition(';base64,')
+        file = self.decode(encoded)
+        extension = self.check_image(file)
+        return File(file, name=f'{uuid.uuid4()}.{extension}')
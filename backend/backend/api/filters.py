@@ -1,38 +1,70 @@
-from django_filters import AllValuesMultipleFilter
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 from django_filters.widgets import BooleanWidget
-from rest_framework.filters import SearchFilter
 
-from .models import Recipe
+from .models import Favorite, Recipe, ShoppingCart, Tag
+from .search import search_recipes
 
 
 class RecipeFilter(filters.FilterSet):
+    """Фильтры рецептов.
+
+    Все условия накладываются на пришедший queryset подзапросами
+    EXISTS, без JOIN по связям многие-ко-многим, поэтому фильтры
+    сочетаются в любом порядке и не дают дублей.
+    """
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart', widget=BooleanWidget()
     )
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited', widget=BooleanWidget()
     )
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+        method='filter_tags'
+    )
+    search = filters.CharFilter(method='filter_search')
 
-    def filter_is_favorited(self, queryset, name, value):
+    def filter_user_relation(self, queryset, model, annotation, value):
         user = self.request.user
-        if value:
-            return Recipe.objects.filter(favorite__user=user)
-        return queryset
+        if not value:
+            return queryset
+        if not user.is_authenticated:
+            return queryset.none()
+        if annotation not in queryset.query.annotations:
+            queryset = queryset.annotate(**{annotation: Exists(
+                model.objects.filter(user=user, recipe=OuterRef('pk'))
+            )})
+        return queryset.filter(**{annotation: True})
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_user_relation(
+            queryset, Favorite, 'is_favorited', value
+        )
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if value:
-            return Recipe.objects.filter(shopping_cart__user=user)
-        return queryset
+        return self.filter_user_relation(
+            queryset, ShoppingCart, 'is_in_shopping_cart', value
+        )
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.annotate(has_tags=Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__in=value
+            )
+        )).filter(has_tags=True)
+
+    def filter_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
 
     class Meta:
         model = Recipe
         fields = [
-            'tags__slug', 'is_favorited', 'is_in_shopping_cart', 'author'
+            'tags', 'is_favorited', 'is_in_shopping_cart', 'author', 'search'
         ]
-
-
-class IngredientFilter(SearchFilter):
-    search_param = 'name'
@@ -0,0 +1,118 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import Recipe
+from .versions import RECIPES, bump_versions
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipe/images/variants'
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    """Пул потоков создаётся при первом обращении, один на процесс."""
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_WORKERS,
+        thread_name_prefix='recipe-images'
+    )
+
+
+def variant_name(image_name, variant, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{VARIANTS_DIR}/{stem}_{variant}.{extension}'
+
+
+def get_variant_urls(recipe):
+    """Ссылки на уменьшенные копии фото; пока их нет, ссылка на оригинал."""
+    name = recipe.image.name
+    if not name:
+        return None
+    if recipe.image_variants_for != name:
+        url = recipe.image.url
+        return {
+            f'{variant}{suffix}': url
+            for variant in settings.IMAGE_VARIANTS for suffix in ('', '_webp')
+        }
+    extension = os.path.splitext(name)[1].lstrip('.').lower() or 'png'
+    urls = {}
+    for variant in settings.IMAGE_VARIANTS:
+        urls[variant] = default_storage.url(
+            variant_name(name, variant, extension)
+        )
+        urls[f'{variant}_webp'] = default_storage.url(
+            variant_name(name, variant, 'webp')
+        )
+    return urls
+
+
+def encode(image, image_format):
+    if image_format in ('JPEG', 'WEBP') and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    if image_format == 'JPEG' and image.mode == 'RGBA':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=settings.IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def save_file(name, content):
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(content))
+
+
+def generate_variants(recipe_id, image_name):
+    """Сохраняет уменьшенные копии фото рецепта и их WebP-версии."""
+    with default_storage.open(image_name) as file:
+        source = Image.open(file)
+        source.load()
+    image_format = source.format or 'PNG'
+    extension = os.path.splitext(image_name)[1].lstrip('.').lower() or 'png'
+    for variant, size in settings.IMAGE_VARIANTS.items():
+        image = source.copy()
+        image.thumbnail(size)
+        save_file(
+            variant_name(image_name, variant, extension),
+            encode(image, image_format)
+        )
+        save_file(
+            variant_name(image_name, variant, 'webp'), encode(image, 'WEBP')
+        )
+    if Recipe.objects.filter(id=recipe_id, image=image_name).update(
+        image_variants_for=image_name, updated=timezone.now()
+    ):
+        bump_versions(RECIPES)
+
+
+def process_in_background(recipe_id, image_name):
+    """Задача пула: у каждого потока своё соединение с базой.
+
+    Вне цикла запроса Django их не закрывает, поэтому поток закрывает
+    соединение сам, иначе оно остаётся открытым до конца процесса.
+    """
+    close_old_connections()
+    try:
+        generate_variants(recipe_id, image_name)
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe):
+    """После коммита ставит обработку фото в пул потоков."""
+    recipe_id, image_name = recipe.id, recipe.image.name
+    transaction.on_commit(lambda: get_executor().submit(
+        process_in_background, recipe_id, image_name
+    ))
@@ -0,0 +1,152 @@
+from django.db import connection, connections
+
+from .models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+)
+from users.models import User
+
+# Индексы, которые нельзя описать в Meta.indexes на Django 2.2:
+# name__istartswith превращается в UPPER(name) LIKE UPPER(%s),
+# поэтому нужен индекс по выражению с varchar_pattern_ops.
+# GIN-индекс по search_vector в Meta.indexes сломал бы migrate на SQLite.
+POSTGRESQL_INDEXES = {
+    'ingredient_name_upper_prefix_idx': (
+        'CREATE INDEX IF NOT EXISTS ingredient_name_upper_prefix_idx '
+        'ON api_ingredient (UPPER(name) varchar_pattern_ops)'
+    ),
+    'recipe_search_vector_idx': (
+        'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+        'ON api_recipe USING GIN (search_vector)'
+    ),
+}
+
+# На SQLite полнотекстовый поиск по рецептам идёт через таблицу FTS5,
+# rowid которой совпадает с id рецепта.
+SQLITE_TABLES = {
+    'api_recipe_fts': (
+        'CREATE VIRTUAL TABLE IF NOT EXISTS api_recipe_fts '
+        'USING fts5(name, ingredients, text, '
+        "tokenize='unicode61 remove_diacritics 2')"
+    ),
+}
+
+
+def create_postgresql_indexes(sender, using='default', **kwargs):
+    db = connections[using]
+    if db.vendor != 'postgresql':
+        return
+    with db.cursor() as cursor:
+        for sql in POSTGRESQL_INDEXES.values():
+            cursor.execute(sql)
+
+
+def create_sqlite_tables(sender, using='default', **kwargs):
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        for sql in SQLITE_TABLES.values():
+            cursor.execute(sql)
+
+
+def explain(queryset):
+    """План запроса; на PostgreSQL без последовательного сканирования,
+    чтобы на небольших данных проверялась сама возможность взять индекс.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    return queryset.explain()
+
+
+def seed_plan_data(recipes_count):
+    """Данные, на которых EXPLAIN проверяет индексы API."""
+    User.objects.bulk_create(
+        User(
+            username=f'plan_user_{number}',
+            email=f'plan_user_{number}@example.com',
+            first_name='plan', last_name='user'
+        ) for number in range(20)
+    )
+    users = list(User.objects.filter(username__startswith='plan_user_'))
+    Tag.objects.bulk_create(
+        Tag(name=f'plan_tag_{number}', color=f'#p{number:05d}',
+            slug=f'plan_tag_{number}')
+        for number in range(5)
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'план ингредиент {number}', measurement_unit='г')
+        for number in range(200)
+    )
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=users[number % len(users)],
+            name=f'plan_recipe_{number}', text='plan',
+            cooking_time=1, image='recipe/images/plan.png'
+        ) for number in range(recipes_count)
+    )
+    recipes = list(Recipe.objects.filter(
+        name__startswith='plan_recipe_'
+    ).values_list('id', flat=True))
+    ingredients = list(Ingredient.objects.filter(
+        name__startswith='план'
+    ).values_list('id', flat=True))
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe_id=recipe_id,
+            ingredient_id=ingredients[recipe_id % len(ingredients)],
+            amount=1
+        ) for recipe_id in recipes
+    )
+    for model in (Favorite, ShoppingCart):
+        model.objects.bulk_create(
+            model(user=user, recipe_id=recipe_id)
+            for user in users for recipe_id in recipes[::50]
+        )
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    return users[0], recipes[0]
+
+
+def get_plan_cases(user, recipe_id):
+    """Запросы API: (название, queryset, ожидаемый индекс)."""
+    cases = [
+        (
+            'Лента рецептов по дате',
+            Recipe.objects.order_by('pub_date', 'id')[:6],
+            'recipe_pub_date_id_idx'
+        ),
+        (
+            'Рецепты автора',
+            Recipe.objects.filter(author=user).order_by('pub_date'),
+            'recipe_author_pub_date_idx'
+        ),
+        (
+            'Рецепты по популярности',
+            Recipe.objects.order_by('-favorites_count')[:6],
+            'recipe_favorites_count_idx'
+        ),
+        (
+            'Избранное рецепта',
+            Favorite.objects.filter(recipe_id=recipe_id),
+            'favorite_recipe_user_idx'
+        ),
+        (
+            'Рецепт в списках покупок',
+            ShoppingCart.objects.filter(recipe_id=recipe_id),
+            'shopping_cart_recipe_user_idx'
+        ),
+        (
+            'Ингредиенты рецепта',
+            RecipeIngredient.objects.filter(recipe_id=recipe_id),
+            'recipe_ingr_recipe_ingr_idx'
+        ),
+    ]
+    if connection.vendor == 'postgresql':
+        cases.append((
+            'Поиск ингредиента по началу названия',
+            Ingredient.objects.filter(name__istartswith='план'),
+            'ingredient_name_upper_prefix_idx'
+        ))
+    return cases
@@ -0,0 +1,72 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .models import Ingredient
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти для поиска по началу названия.
+
+    Хранит отсортированный список нормализованных названий и ищет
+    по нему бинарным поиском. Строится при первом запросе, сбрасывается
+    сигналами Ingredient и перестраивается не реже чем раз в ttl секунд,
+    чтобы изменения из других процессов тоже попадали в индекс.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._keys = None
+        self._items = None
+        self._built_at = None
+
+    def build(self):
+        entries = sorted(
+            (normalize(name), name, pk, unit)
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).order_by()
+        )
+        keys = [entry[0] for entry in entries]
+        items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, name, pk, unit in entries
+        ]
+        with self._lock:
+            self._keys, self._items = keys, items
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def is_stale(self):
+        return self._built_at is None or (
+            self.ttl is not None
+            and time.monotonic() - self._built_at > self.ttl
+        )
+
+    def search(self, prefix='', limit=None):
+        if self.is_stale():
+            self.build()
+        keys, items = self._keys, self._items
+        prefix = normalize(prefix)
+        start = bisect_left(keys, prefix)
+        results = []
+        for position in range(start, len(keys)):
+            if not keys[position].startswith(prefix):
+                break
+            if limit is not None and len(results) >= limit:
+                break
+            results.append(items[position])
+        return results
+
+
+ingredient_index = IngredientIndex(ttl=settings.INGREDIENT_INDEX_TTL)
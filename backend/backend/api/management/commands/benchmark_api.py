@@ -0,0 +1,382 @@
+import base64
+import io
+import json
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.middleware import QueryRecorder
+from api.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+)
+from api.search import update_search_index
+from api.shopping_list import rebuild_shopping_lists
+from api.utils import bulk_create_in_batches, percentile, rolled_back
+from users.models import Subscribe, User
+
+SCENARIOS = (
+    'recipes_list',
+    'recipes_list_anonymous',
+    'recipes_filter',
+    'recipes_search',
+    'recipe_detail',
+    'recipes_cook',
+    'subscriptions',
+    'users_list',
+    'users_me',
+    'shopping_cart_download',
+    'recipe_create',
+)
+
+WORDS = (
+    'борщ', 'суп', 'салат', 'пирог', 'блины', 'каша', 'котлеты', 'плов',
+    'рагу', 'запеканка', 'омлет', 'соус', 'курица', 'грибы', 'сыр', 'рис',
+)
+
+
+def current_commit():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def tiny_png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), '#ffaa00').save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер API: наполняет базу синтетическими данными '
+        'внутри транзакции, прогоняет запросы к маршрутам API через '
+        'тестовый клиент, выводит пропускную способность, перцентили '
+        'времени ответа и число запросов к базе, после чего откатывает '
+        'изменения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Подписок на пользователя'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Рецептов в избранном у пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=10,
+            help='Рецептов в списке покупок у пользователя'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Замеряемых запросов на сценарий'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Запросов на сценарий до начала замеров'
+        )
+        parser.add_argument(
+            '--scenario', action='append', choices=SCENARIOS,
+            help='Запустить только эти сценарии'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Размер пачки при создании данных'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--json', dest='json_path',
+            help='Записать результаты в JSON-файл ("-" - в stdout)'
+        )
+        parser.add_argument(
+            '--compare', help='JSON предыдущего запуска для сравнения'
+        )
+
+    def seed(self, options):
+        generator = self.generator
+        batch_size = options['batch_size']
+        password = make_password('benchmark')
+        bulk_create_in_batches(User, (
+            User(
+                username=f'bench_user_{number}',
+                email=f'bench_user_{number}@example.com',
+                first_name='bench', last_name='user', password=password
+            ) for number in range(options['users'])
+        ), batch_size)
+        users = list(User.objects.filter(
+            username__startswith='bench_user_'
+        ).values_list('id', flat=True))
+        Token.objects.bulk_create(
+            Token(user_id=user_id, key=Token.generate_key())
+            for user_id in users
+        )
+        Tag.objects.bulk_create(
+            Tag(name=f'bench_tag_{number}', color=f'#{number:06x}',
+                slug=f'bench_tag_{number}')
+            for number in range(options['tags'])
+        )
+        bulk_create_in_batches(Ingredient, (
+            Ingredient(name=f'bench ингредиент {number}', measurement_unit='г')
+            for number in range(options['ingredients'])
+        ), batch_size)
+        tags = list(Tag.objects.filter(
+            slug__startswith='bench_tag_'
+        ).values_list('id', 'slug'))
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='bench ингредиент'
+        ).values_list('id', flat=True))
+        bulk_create_in_batches(Recipe, (
+            Recipe(
+                author_id=generator.choice(users),
+                name=' '.join(generator.sample(WORDS, 3)),
+                text=' '.join(generator.choices(WORDS, k=20)),
+                cooking_time=generator.randint(5, 120),
+                image='recipe/images/benchmark.png'
+            ) for _ in range(options['recipes'])
+        ), batch_size)
+        recipes = list(Recipe.objects.filter(
+            author__in=users
+        ).values_list('id', flat=True))
+        per_recipe = min(options['ingredients_per_recipe'], len(ingredients))
+        bulk_create_in_batches(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=generator.randint(1, 500)
+            ) for recipe_id in recipes
+            for ingredient_id in generator.sample(ingredients, per_recipe)
+        ), batch_size)
+        bulk_create_in_batches(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipes
+            for tag_id, _ in generator.sample(tags, min(2, len(tags)))
+        ), batch_size)
+        relations = (
+            (Subscribe, 'author_id', users, options['subscriptions']),
+            (Favorite, 'recipe_id', recipes, options['favorites']),
+            (ShoppingCart, 'recipe_id', recipes, options['cart']),
+        )
+        for model, field, targets, count in relations:
+            bulk_create_in_batches(model, (
+                model(user_id=user_id, **{field: target})
+                for user_id in users
+                for target in generator.sample(
+                    [target for target in targets if target != user_id]
+                    if model is Subscribe else targets,
+                    min(count, len(targets) - 1)
+                )
+            ), batch_size)
+        # Сигналы при bulk_create не срабатывают, поэтому списки покупок
+        # и поисковый индекс собираются явно.
+        rebuild_shopping_lists(users)
+        update_search_index()
+        return {
+            'users': users,
+            'tokens': dict(Token.objects.filter(
+                user__in=users
+            ).values_list('user', 'key')),
+            'recipes': recipes,
+            'tags': [slug for _, slug in tags],
+            'tag_ids': [tag_id for tag_id, _ in tags],
+            'ingredients': ingredients,
+        }
+
+    # Каждый request_<сценарий> возвращает (метод, путь, тело, с токеном ли).
+
+    def request_recipes_list(self, data):
+        page = self.generator.randint(1, min(len(data['recipes']) // 6, 20))
+        return 'get', f'/api/recipes/?page={max(page, 1)}', None, True
+
+    def request_recipes_list_anonymous(self, data):
+        method, path, body, _ = self.request_recipes_list(data)
+        return method, path, body, False
+
+    def request_recipes_filter(self, data):
+        tag = self.generator.choice(data['tags'])
+        return 'get', f'/api/recipes/?tags={tag}&is_favorited=1', None, True
+
+    def request_recipes_search(self, data):
+        word = self.generator.choice(WORDS)
+        return 'get', f'/api/recipes/?search={word}', None, True
+
+    def request_recipe_detail(self, data):
+        recipe = self.generator.choice(data['recipes'])
+        return 'get', f'/api/recipes/{recipe}/', None, True
+
+    def request_recipes_cook(self, data):
+        query = '&'.join(
+            f'ingredients={ingredient}' for ingredient
+            in self.generator.sample(data['ingredients'], 10)
+        )
+        return 'get', f'/api/recipes/cook/?{query}&limit=6', None, True
+
+    def request_subscriptions(self, data):
+        return 'get', '/api/users/subscriptions/?recipes_limit=3', None, True
+
+    def request_users_list(self, data):
+        return 'get', '/api/users/', None, True
+
+    def request_users_me(self, data):
+        return 'get', '/api/users/me/', None, True
+
+    def request_shopping_cart_download(self, data):
+        return 'get', (
+            '/api/recipes/download_shopping_cart/?format=txt'
+        ), None, True
+
+    def request_recipe_create(self, data):
+        generator = self.generator
+        return 'post', '/api/recipes/', {
+            'name': ' '.join(generator.sample(WORDS, 3)),
+            'text': ' '.join(generator.choices(WORDS, k=20)),
+            'cooking_time': generator.randint(5, 120),
+            'image': self.image,
+            'tags': generator.sample(data['tag_ids'], 1),
+            'ingredients': [
+                {'id': ingredient, 'amount': generator.randint(1, 500)}
+                for ingredient in generator.sample(data['ingredients'], 5)
+            ],
+        }, True
+
+    def send(self, client, data, scenario):
+        method, path, body, authenticated = getattr(
+            self, f'request_{scenario}'
+        )(data)
+        headers = {}
+        if authenticated:
+            token = data['tokens'][self.generator.choice(data['users'])]
+            headers['HTTP_AUTHORIZATION'] = f'Token {token}'
+        if body is not None:
+            headers['data'] = json.dumps(body)
+            headers['content_type'] = 'application/json'
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = getattr(client, method)(path, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - start
+        return elapsed, recorder.count, response.status_code
+
+    def run_scenario(self, client, data, scenario, options):
+        for _ in range(options['warmup']):
+            self.send(client, data, scenario)
+        timings, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            elapsed, count, status = self.send(client, data, scenario)
+            timings.append(elapsed * 1000)
+            queries.append(count)
+            if status >= 400:
+                errors += 1
+        wall = time.perf_counter() - started
+        return {
+            'requests': len(timings),
+            'errors': errors,
+            'rps': round(len(timings) / wall, 1),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    def write_table(self, results, previous):
+        self.stdout.write(
+            f'{"сценарий":<24} {"rps":>8} {"p50":>9} {"p95":>9} '
+            f'{"p99":>9} {"запросы":>8} {"ошибки":>7}'
+        )
+        for scenario, result in results.items():
+            line = (
+                f'{scenario:<24} {result["rps"]:>8} '
+                f'{result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+                f'{result["p99_ms"]:>9.2f} {result["queries_mean"]:>8} '
+                f'{result["errors"]:>7}'
+            )
+            before = previous.get(scenario)
+            if before:
+                change = (
+                    result['p50_ms'] - before['p50_ms']
+                ) / before['p50_ms'] * 100
+                line += (
+                    f'  p50 {change:+.0f}%, запросы '
+                    f'{before["queries_mean"]} -> {result["queries_mean"]}'
+                )
+            self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        self.generator = random.Random(options['seed'])
+        self.image = tiny_png()
+        scenarios = options['scenario'] or SCENARIOS
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['scenarios']
+        client = Client()
+        report = {
+            'commit': current_commit(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'dataset': {
+                key: options[key] for key in (
+                    'users', 'recipes', 'tags', 'ingredients',
+                    'ingredients_per_recipe', 'subscriptions',
+                    'favorites', 'cart', 'seed'
+                )
+            },
+            'scenarios': {},
+        }
+        # Загруженные в сценарии создания фото не должны остаться в MEDIA_ROOT.
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            MEDIA_ROOT=media_root
+        ):
+            with rolled_back():
+                start = time.perf_counter()
+                data = self.seed(options)
+                report['seed_seconds'] = round(
+                    time.perf_counter() - start, 2
+                )
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE')
+                for scenario in scenarios:
+                    report['scenarios'][scenario] = self.run_scenario(
+                        client, data, scenario, options
+                    )
+        self.stdout.write(
+            f'База: {report["database"]}, коммит: {report["commit"]}, '
+            f'данные созданы за {report["seed_seconds"]} с'
+        )
+        self.write_table(report['scenarios'], previous)
+        if options['json_path'] == '-':
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        elif options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,173 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import (
+    Count, ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Subquery
+)
+from django.db.models.functions import Cast
+
+from api.cook_index import RecipeCoverageIndex
+from api.models import Ingredient, Recipe, RecipeIngredient
+from api.utils import bulk_create_in_batches, percentile, rolled_back
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет подбор рецептов по продуктам через обратный индекс и '
+        'через SQL на синтетических данных; данные создаются внутри '
+        'транзакции и откатываются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=100000,
+            help='Сколько рецептов создать'
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Сколько ингредиентов создать'
+        )
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help='Количество запросов на каждый размер набора продуктов'
+        )
+        parser.add_argument(
+            '--sql-queries', type=int, default=20,
+            help='Количество запросов через SQL для сравнения'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=50,
+            help='Сколько рецептов возвращать'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Размер пачки при создании данных'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора данных'
+        )
+
+    def seed(self, generator, options):
+        author = User.objects.create(
+            username='cook_benchmark', email='cook_benchmark@example.com',
+            first_name='cook', last_name='benchmark'
+        )
+        bulk_create_in_batches(Ingredient, (
+            Ingredient(name=f'cook ингредиент {number}', measurement_unit='г')
+            for number in range(options['ingredients'])
+        ), options['batch_size'])
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='cook ингредиент'
+        ).values_list('id', flat=True))
+        # Популярность ингредиентов по закону Ципфа: соль и лук
+        # встречаются почти везде, экзотика - в единичных рецептах.
+        weights = [1 / rank for rank in range(1, len(ingredients) + 1)]
+        bulk_create_in_batches(Recipe, (
+            Recipe(
+                author=author, name=f'cook рецепт {number}', text='cook',
+                cooking_time=1, image='recipe/images/benchmark.png'
+            ) for number in range(options['recipes'])
+        ), options['batch_size'])
+
+        def recipe_ingredients(recipe_id):
+            chosen = set(generator.choices(
+                ingredients, weights, k=generator.randint(5, 12)
+            ))
+            for ingredient_id in chosen:
+                yield RecipeIngredient(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id, amount=1
+                )
+
+        bulk_create_in_batches(RecipeIngredient, (
+            row for recipe_id in list(
+                author.recipes.values_list('id', flat=True)
+            ) for row in recipe_ingredients(recipe_id)
+        ), options['batch_size'])
+        return ingredients, weights
+
+    def sql_match(self, ingredient_ids, limit):
+        totals = RecipeIngredient.objects.filter(
+            recipe=OuterRef('recipe')
+        ).order_by().values('recipe').annotate(
+            total=Count('ingredient', distinct=True)
+        ).values('total')
+        return [
+            row['recipe'] for row in RecipeIngredient.objects.filter(
+                ingredient__in=ingredient_ids
+            ).order_by().values('recipe').annotate(
+                matched=Count('ingredient', distinct=True),
+                total=Subquery(totals, output_field=IntegerField()),
+            ).annotate(coverage=ExpressionWrapper(
+                Cast(F('matched'), FloatField()) / F('total'),
+                output_field=FloatField()
+            )).order_by('-coverage', '-matched', 'recipe')[:limit]
+        ]
+
+    def measure(self, search, queries):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, title, timings):
+        self.stdout.write(
+            f'{title}: p50 {percentile(timings, 50):.2f} мс, '
+            f'p95 {percentile(timings, 95):.2f} мс, '
+            f'p99 {percentile(timings, 99):.2f} мс'
+        )
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        limit = options['limit']
+        with rolled_back():
+            start = time.perf_counter()
+            ingredients, weights = self.seed(generator, options)
+            seed_time = time.perf_counter() - start
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            index = RecipeCoverageIndex()
+            start = time.perf_counter()
+            index.build()
+            build_time = time.perf_counter() - start
+            recipes_count, size = index.size()
+            self.stdout.write(
+                f'База: {connection.vendor}, рецептов: {recipes_count}, '
+                f'размер индекса: {size / 1024 / 1024:.1f} МБ\n'
+                f'Создание данных: {seed_time:.1f} с\n'
+                f'Построение индекса: {build_time:.2f} с'
+            )
+            for pantry_size in (5, 10, 20):
+                pantries = [
+                    set(generator.choices(
+                        ingredients, weights, k=pantry_size
+                    )) for _ in range(options['queries'])
+                ]
+                timings = self.measure(
+                    lambda pantry: index.match(pantry, limit), pantries
+                )
+                self.report(f'Индекс, {pantry_size} продуктов', timings)
+                sql_pantries = pantries[:options['sql_queries']]
+                if not sql_pantries:
+                    continue
+                timings = self.measure(
+                    lambda pantry: self.sql_match(pantry, limit),
+                    sql_pantries
+                )
+                self.report(f'SQL, {pantry_size} продуктов', timings)
+                mismatches = sum(
+                    [recipe_id for recipe_id, _, _ in index.match(
+                        pantry, limit
+                    )] != self.sql_match(pantry, limit)
+                    for pantry in sql_pantries
+                )
+                self.stdout.write(
+                    f'Расхождений с SQL: {mismatches} '
+                    f'из {len(sql_pantries)}'
+                )
@@ -0,0 +1,64 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.ingredient_index import IngredientIndex
+from api.models import Ingredient
+from api.serializers import IngredientSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск ингредиентов через индекс в памяти и через SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queries', type=int, default=500,
+            help='Количество поисковых запросов'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора префиксов'
+        )
+
+    def measure(self, search, prefixes):
+        start = time.perf_counter()
+        for prefix in prefixes:
+            search(prefix)
+        return (time.perf_counter() - start) / len(prefixes) * 1000
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            self.stderr.write('Нет ингредиентов, сначала выполните get_data')
+            return
+        generator = random.Random(options['seed'])
+        prefixes = [
+            generator.choice(names)[:generator.randint(1, 4)]
+            for _ in range(options['queries'])
+        ]
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        index = IngredientIndex()
+        start = time.perf_counter()
+        index.build()
+        build_time = (time.perf_counter() - start) * 1000
+
+        def sql_search(prefix):
+            return IngredientSerializer(
+                Ingredient.objects.filter(name__istartswith=prefix)[:limit],
+                many=True
+            ).data
+
+        def index_search(prefix):
+            return index.search(prefix, limit)
+
+        sql_time = self.measure(sql_search, prefixes)
+        index_time = self.measure(index_search, prefixes)
+        self.stdout.write(
+            f'Ингредиентов: {len(names)}, запросов: {len(prefixes)}\n'
+            f'Построение индекса: {build_time:.2f} мс\n'
+            f'SQL: {sql_time:.3f} мс/запрос\n'
+            f'Индекс: {index_time:.3f} мс/запрос\n'
+            f'Ускорение: {sql_time / index_time:.1f}x'
+        )
@@ -0,0 +1,148 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from api.models import Ingredient, Recipe, RecipeIngredient
+from api.paginators import CustomPaginator
+from api.search import search_recipes, update_search_index
+from api.utils import bulk_create_in_batches, percentile, rolled_back
+from users.models import User
+
+WORDS = (
+    'борщ', 'суп', 'салат', 'пирог', 'блины', 'каша', 'котлеты', 'плов',
+    'рагу', 'запеканка', 'омлет', 'соус', 'окрошка', 'пельмени', 'вареники',
+    'курица', 'говядина', 'свинина', 'рыба', 'грибы', 'картофель', 'капуста',
+    'морковь', 'свекла', 'лук', 'чеснок', 'томаты', 'огурцы', 'сыр',
+    'сметана', 'творог', 'яйца', 'мука', 'рис', 'гречка', 'яблоки', 'тыква',
+    'шпинат', 'фасоль', 'укроп', 'быстрый', 'домашний', 'праздничный',
+    'острый', 'сладкий', 'печёный', 'жареный', 'тушёный', 'летний', 'зимний',
+)
+
+INGREDIENT_PREFIX = 'search'
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает полнотекстовый поиск рецептов с поиском через '
+        'icontains на синтетических данных; данные создаются внутри '
+        'транзакции и откатываются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=100000,
+            help='Сколько рецептов создать'
+        )
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help='Количество поисковых запросов'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Размер пачки при создании данных'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора данных'
+        )
+
+    def seed(self, generator, recipes_count, batch_size):
+        author = User.objects.create(
+            username='search_benchmark', email='search_benchmark@example.com',
+            first_name='search', last_name='benchmark'
+        )
+        # Префикс не даёт совпасть с ингредиентами из get_data
+        # (например, «сыр домашний») и отделяет созданные здесь.
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'{INGREDIENT_PREFIX} {first} {second}',
+                measurement_unit='г'
+            ) for first in WORDS[15:40] for second in WORDS[40:]
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith=f'{INGREDIENT_PREFIX} '
+        ).values_list('id', flat=True))
+        bulk_create_in_batches(Recipe, (
+            Recipe(
+                author=author,
+                name=' '.join(generator.sample(WORDS, 3)),
+                text=' '.join(generator.choices(WORDS, k=30)),
+                cooking_time=1, image='recipe/images/benchmark.png'
+            ) for _ in range(recipes_count)
+        ), batch_size)
+        recipes = list(author.recipes.values_list('id', flat=True))
+        bulk_create_in_batches(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id, amount=1
+            ) for recipe_id in recipes
+            for ingredient_id in generator.sample(ingredients, 3)
+        ), batch_size)
+
+    def measure(self, search, queries):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, title, timings):
+        self.stdout.write(
+            f'{title}: p50 {percentile(timings, 50):.2f} мс, '
+            f'p95 {percentile(timings, 95):.2f} мс, '
+            f'p99 {percentile(timings, 99):.2f} мс'
+        )
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        queries = [
+            ' '.join(generator.sample(WORDS, generator.randint(1, 2)))
+            for _ in range(options['queries'])
+        ]
+        page_size = CustomPaginator.page_size
+
+        def page(queryset):
+            # Как в API: количество найденного и первая страница.
+            queryset.count()
+            list(queryset.values_list('id', flat=True)[:page_size])
+
+        def full_text_search(query):
+            page(search_recipes(Recipe.objects.all(), query))
+
+        def icontains_search(query):
+            condition = Q()
+            for word in query.split():
+                condition &= (
+                    Q(name__icontains=word) | Q(text__icontains=word)
+                    | Q(ingredients__name__icontains=word)
+                )
+            page(Recipe.objects.filter(condition).distinct())
+
+        with rolled_back():
+            start = time.perf_counter()
+            self.seed(
+                generator, options['recipes'], options['batch_size']
+            )
+            seed_time = time.perf_counter() - start
+            start = time.perf_counter()
+            update_search_index()
+            index_time = time.perf_counter() - start
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            self.stdout.write(
+                f'База: {connection.vendor}, '
+                f'рецептов: {options["recipes"]}, '
+                f'запросов: {len(queries)}\n'
+                f'Создание данных: {seed_time:.1f} с\n'
+                f'Построение индекса: {index_time:.1f} с'
+            )
+            full_text = self.measure(full_text_search, queries)
+            icontains = self.measure(icontains_search, queries)
+            self.report('Полнотекстовый поиск', full_text)
+            self.report('icontains', icontains)
+            speedup = percentile(icontains, 50) / percentile(full_text, 50)
+            self.stdout.write(f'Ускорение по p50: {speedup:.1f}x')
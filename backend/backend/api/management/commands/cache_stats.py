@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.authentication import get_token_cache_stats
+from api.caches import get_cache_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Выводит попадания и промахи по каждому кэшу. Для locmem видна '
+        'статистика только процесса команды, для file и db - сумма по '
+        'всем процессам. Кэш токенов (tokens) всегда свой у процесса: '
+        'по работающему серверу его показывает GET /api/cache-stats/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Вывести отчёт в JSON'
+        )
+
+    def handle(self, *args, **options):
+        report = get_cache_stats() + [get_token_cache_stats()]
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        for row in report:
+            self.stdout.write(
+                f'{row["name"]} ({row["backend"]}): hits={row["hits"]} '
+                f'misses={row["misses"]} hit_rate={row["hit_rate"]}'
+            )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.indexes import explain, get_plan_cases, seed_plan_data
+from api.utils import rolled_back
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу тестовыми данными внутри транзакции, проверяет '
+        'через EXPLAIN, что запросы API используют индексы, и откатывает '
+        'изменения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=2000,
+            help='Сколько рецептов создать'
+        )
+
+    def handle(self, *args, **options):
+        failures = []
+        with rolled_back():
+            user, recipe_id = seed_plan_data(options['recipes'])
+            for title, queryset, index in get_plan_cases(user, recipe_id):
+                plan = explain(queryset)
+                if index in plan:
+                    self.stdout.write(f'OK   {title}: {index}')
+                else:
+                    failures.append(title)
+                    self.stdout.write(
+                        f'FAIL {title}: ожидался {index}\n{plan}'
+                    )
+        if failures:
+            raise CommandError(
+                f'Индексы не используются: {", ".join(failures)}'
+            )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from api.images import generate_variants
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии фото для рецептов, у которых их нет'
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image_variants_for=F('image')
+        ).values_list('id', 'image')
+        processed = 0
+        for recipe_id, image_name in recipes.iterator():
+            try:
+                generate_variants(recipe_id, image_name)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'recipe={recipe_id}: {error}')
+                continue
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {processed}'
+        ))
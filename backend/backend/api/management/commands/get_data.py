@@ -1,25 +1,120 @@
-import simplejson
+import csv
+import os
+import time
 
-from django.core.management.base import BaseCommand
+import simplejson
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from api.models import Tag, Ingredient
+from api.versions import INGREDIENTS, RECIPES, TAGS, bump_versions
+
+TAG_DATA = [
+    {'name': 'lunch', 'color': '#4b5c38', 'slug': 'lunch'},
+    {'name': 'dinner', 'color': '#5a0e2d', 'slug': 'dinner'},
+    {'name': 'sup', 'color': '#e5c07b', 'slug': 'sup'}
+]
+
+CHUNK_SIZE = 64 * 1024
+
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
+
+
+def iter_json(file):
+    """Читает JSON-массив объектов по одному, не загружая файл целиком."""
+    decoder = simplejson.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] == ']':
+                return
+            try:
+                obj, position = decoder.raw_decode(buffer, position)
+            except simplejson.JSONDecodeError:
+                if not chunk:
+                    raise
+                break
+            yield obj
+        if not chunk:
+            return
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield {'name': name, 'measurement_unit': measurement_unit}
+
+
+READERS = {
+    '.json': iter_json,
+    '.csv': iter_csv,
+}
 
 
 class Command(BaseCommand):
+    help = 'Загружает тэги и ингредиенты из JSON или CSV файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=DEFAULT_PATH,
+            help='Файл с ингредиентами (.json или .csv)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько ингредиентов вставлять за один запрос'
+        )
+
+    def load_ingredients(self, rows, batch_size):
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        batch = []
+        processed = created = 0
+        for processed, row in enumerate(rows, start=1):
+            key = (row['name'], row['measurement_unit'])
+            if key in existing:
+                continue
+            existing.add(key)
+            batch.append(Ingredient(name=key[0], measurement_unit=key[1]))
+            if len(batch) >= batch_size:
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                created += len(batch)
+                batch = []
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        return processed, created + len(batch)
 
     def handle(self, *args, **options):
-        print('Starting data migration...')
-        tag_data = [
-            {'name': 'lunch', 'color': '#4b5c38', 'slug': 'lunch'},
-            {'name': 'dinner', 'color': '#5a0e2d', 'slug': 'dinner'},
-            {'name': 'sup', 'color': '#e5c07b', 'slug': 'sup'}
-        ]
-
-        for data in tag_data:
-            Tag.objects.get_or_create(**data)
-
-        f = open('data/ingredients.json', 'r', encoding='UTF-8')
-        obj = simplejson.load(f)
-        for data in obj:
-            Ingredient.objects.get_or_create(**data)
-        print('Data migration comlete')
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .json и .csv')
+        self.stdout.write('Starting data migration...')
+        start = time.perf_counter()
+        with open(path, 'r', encoding='UTF-8') as file, transaction.atomic():
+            Tag.objects.bulk_create(
+                [Tag(**data) for data in TAG_DATA], ignore_conflicts=True
+            )
+            processed, created = self.load_ingredients(
+                reader(file), options['batch_size']
+            )
+            bump_versions(TAGS, INGREDIENTS, RECIPES)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Обработано строк: {processed}, добавлено ингредиентов: '
+            f'{created} за {elapsed:.2f} с ({processed / elapsed:.0f} строк/с)'
+        )
+        self.stdout.write('Data migration comlete')
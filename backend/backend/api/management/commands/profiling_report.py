@@ -0,0 +1,80 @@
+import json
+import os
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.utils import percentile
+
+METRICS = (
+    'queries', 'sql_ms', 'view_ms', 'render_ms', 'total_ms', 'size'
+)
+
+PERCENTILES = (50, 95, 99)
+
+
+def read_records(path):
+    for name in (f'{path}.1', path):
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = 'Выводит перцентили замеров ProfilingMiddleware по маршрутам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window', type=int, default=1000,
+            help='Сколько последних замеров учитывать для каждого маршрута'
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Вывести отчёт в JSON'
+        )
+
+    def handle(self, *args, **options):
+        routes = defaultdict(lambda: deque(maxlen=options['window']))
+        for record in read_records(settings.PROFILING['LOG_FILE']):
+            routes[(record['route'], record['method'])].append(record)
+        report = []
+        for (route, method), records in sorted(routes.items()):
+            row = {'route': route, 'method': method, 'count': len(records)}
+            for metric in METRICS:
+                values = [
+                    record[metric] for record in records
+                    if record.get(metric) is not None
+                ]
+                for percent in PERCENTILES:
+                    row[f'{metric}_p{percent}'] = (
+                        percentile(values, percent) if values else None
+                    )
+            statuses = [
+                record['token_cache'] for record in records
+                if record.get('token_cache') is not None
+            ]
+            row['token_cache_hit_rate'] = round(
+                statuses.count('hit') / len(statuses), 4
+            ) if statuses else None
+            report.append(row)
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        for row in report:
+            self.stdout.write(
+                f'{row["method"]} {row["route"]} (n={row["count"]})'
+            )
+            for metric in METRICS:
+                values = ' '.join(
+                    f'p{percent}={row[f"{metric}_p{percent}"]}'
+                    for percent in PERCENTILES
+                )
+                self.stdout.write(f'    {metric}: {values}')
+            if row['token_cache_hit_rate'] is not None:
+                self.stdout.write(
+                    f'    token_cache: hit_rate={row["token_cache_hit_rate"]}'
+                )
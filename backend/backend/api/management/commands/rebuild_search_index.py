@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Recipe
+from api.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковый индекс всех рецептов'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        update_search_index()
+        self.stdout.write(
+            f'Проиндексировано рецептов: {Recipe.objects.count()} '
+            f'за {time.perf_counter() - start:.1f} с'
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сохранённые списки покупок с корзинами и пересобирает их'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        drift = rebuild_shopping_lists(dry_run=options['dry_run'])
+        for user_id, ingredient_id, stored, expected in drift:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'сохранено {stored}, должно быть {expected}'
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+        elif not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено расхождений: {len(drift)}'
+            ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import Favorite, Recipe, ShoppingCart
+
+
+def count_subquery(model):
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe'
+        ).annotate(total=Count('id')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного и списков покупок у рецептов'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipes = list(
+                Recipe.objects.select_for_update().annotate(
+                    actual_favorites=count_subquery(Favorite),
+                    actual_in_carts=count_subquery(ShoppingCart)
+                ).exclude(
+                    favorites_count=F('actual_favorites'),
+                    in_carts_count=F('actual_in_carts')
+                ).only('id', 'favorites_count', 'in_carts_count')
+            )
+            for recipe in recipes:
+                self.stdout.write(
+                    f'recipe={recipe.id}: избранное '
+                    f'{recipe.favorites_count} -> {recipe.actual_favorites}, '
+                    f'списки покупок '
+                    f'{recipe.in_carts_count} -> {recipe.actual_in_carts}'
+                )
+                recipe.favorites_count = recipe.actual_favorites
+                recipe.in_carts_count = recipe.actual_in_carts
+            Recipe.objects.bulk_update(
+                recipes, ['favorites_count', 'in_carts_count']
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено рецептов: {len(recipes)}'
+        ))
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceededError(Exception):
+    pass
+
+
+class QueryRecorder:
+    """Считает запросы к базе и время их выполнения."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - start
+
+
+def rotate(path, max_size):
+    try:
+        if os.path.getsize(path) > max_size:
+            os.replace(path, f'{path}.1')
+    except OSError:
+        pass
+
+
+class ProfilingMiddleware:
+    """Собирает по каждому маршруту число запросов, время SQL,
+    время представления и рендеринга, размер ответа и попадание
+    токена в кэш.
+
+    view_ms - время представления DRF без SQL: сериализация
+    (serializer.data) и остальной Python-код представления.
+    render_ms - только рендеринг готовых данных в JSON или файл.
+
+    Замеры дописываются JSON-строками в PROFILING['LOG_FILE'],
+    отчёт по ним строит команда profiling_report. Бюджет запросов
+    задаётся для маршрута ('recipes-list') или метода и маршрута
+    ('GET recipes-list'); при превышении пишется предупреждение или,
+    с FAIL_ON_BUDGET, выбрасывается QueryBudgetExceededError.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.config = settings.PROFILING
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request._profiling_recorder = recorder
+        request._profiling_view_start = None
+        request._profiling_view_time = None
+        request._profiling_render_time = 0.0
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        if request._profiling_view_time is None:
+            # Ответ без рендеринга (файл, 304): представление
+            # закончилось вместе с обработкой запроса.
+            self.finish_view(request)
+        match = request.resolver_match
+        if match is None:
+            return response
+        route = match.url_name or match.view_name
+        self.save({
+            'route': route,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'sql_ms': round(recorder.time * 1000, 3),
+            'view_ms': self.to_ms(request._profiling_view_time),
+            'render_ms': self.to_ms(request._profiling_render_time),
+            'total_ms': round(total * 1000, 3),
+            'size': None if response.streaming else len(response.content),
+            'token_cache': getattr(request, '_token_cache', None),
+        })
+        self.check_budget(request.method, route, recorder.count)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._profiling_view_start = (
+            time.perf_counter(), request._profiling_recorder.time
+        )
+
+    def finish_view(self, request):
+        if request._profiling_view_start is None:
+            return
+        start, sql_before = request._profiling_view_start
+        sql = request._profiling_recorder.time - sql_before
+        request._profiling_view_time = time.perf_counter() - start - sql
+
+    @staticmethod
+    def to_ms(seconds):
+        return None if seconds is None else round(seconds * 1000, 3)
+
+    def process_template_response(self, request, response):
+        self.finish_view(request)
+        start = time.perf_counter()
+
+        def finish_render(response):
+            request._profiling_render_time = time.perf_counter() - start
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+    def save(self, record):
+        path = self.config['LOG_FILE']
+        rotate(path, self.config['MAX_FILE_SIZE'])
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record) + '\n')
+
+    def check_budget(self, method, route, count):
+        budgets = self.config['QUERY_BUDGETS']
+        budget = budgets.get(
+            f'{method} {route}',
+            budgets.get(route, self.config['DEFAULT_QUERY_BUDGET'])
+        )
+        if budget is None or count <= budget:
+            return
+        message = f'{method} {route}: {count} запросов при бюджете {budget}'
+        if self.config['FAIL_ON_BUDGET']:
+            raise QueryBudgetExceededError(message)
+        logger.warning(message)
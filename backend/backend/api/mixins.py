@@ -0,0 +1,74 @@
+import calendar
+
+from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .versions import get_versions
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 на GET, если версии ресурсов не изменились.
+
+    ETag и Last-Modified берутся из ResourceVersion, которые
+    увеличиваются сигналами моделей. При совпадении данные
+    не сериализуются, иначе обработчик видит версии
+    в self.resource_versions.
+    """
+    versioned_resources = ()
+
+    def get_versioned_resources(self, request):
+        return self.versioned_resources
+
+    def is_private(self, request):
+        return False
+
+    def conditional_get(self, request, handler, *args, key=None, **kwargs):
+        """key отличает ETag одного объекта от ETag другого."""
+        private = self.is_private(request)
+        versions = get_versions(*self.get_versioned_resources(request))
+        self.resource_versions = {item.name: item.version for item in versions}
+        parts = [f'{item.name}.{item.version}' for item in versions]
+        if key is not None:
+            parts.insert(0, f'id:{key}')
+        if private:
+            parts.insert(0, str(request.user.id))
+        etag = '"{}"'.format('-'.join(parts))
+        last_modified = max(
+            (item.updated for item in versions), default=None
+        )
+        if last_modified is not None:
+            # Last-Modified передаётся с точностью до секунды, с дробным
+            # временем If-Modified-Since никогда бы не совпадал.
+            last_modified = calendar.timegm(last_modified.utctimetuple())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if private:
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Authorization',))
+        else:
+            patch_cache_control(
+                response, public=True, max_age=settings.API_CACHE_MAX_AGE
+            )
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        """Ищет объект до проверки версий: несуществующий даёт 404."""
+        instance = self.get_object()
+        return self.conditional_get(
+            request, self.serialize_instance, instance, key=instance.pk
+        )
+
+    def serialize_instance(self, request, instance):
+        return Response(self.get_serializer(instance).data)
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
 
@@ -63,12 +64,20 @@ class Ingredient(models.Model):
         return f'{self.name} - {self.measurement_unit}'
 
 
+class RecipeManager(models.Manager):
+    """Не читает search_vector: он нужен только в условии поиска."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
-        verbose_name='Автор'
+        verbose_name='Автор',
+        db_index=False
     )
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -106,9 +115,48 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Количество избранных',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'Количество в списках покупок',
+        default=0,
+        editable=False
+    )
+    image_variants_for = models.CharField(
+        'Фото, для которого готовы уменьшенные копии',
+        max_length=255,
+        blank=True,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeManager()
 
     class Meta:
-        ordering = ('pub_date', )
+        ordering = ('pub_date', 'id')
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'], name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count'], name='recipe_favorites_count_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -126,6 +174,7 @@ class RecipeIngredient(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         verbose_name='Рецепт',
+        db_index=False
     )
     amount = models.PositiveSmallIntegerField(
         'Количество',
@@ -135,6 +184,12 @@ class RecipeIngredient(models.Model):
 
     class Meta:
         ordering = ('recipe',)
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient'],
+                name='recipe_ingr_recipe_ingr_idx'
+            )
+        ]
         verbose_name = 'Ингредиент для рецепта'
         verbose_name_plural = 'Ингредиенты для рецепта'
 
@@ -143,11 +198,15 @@ class RecipeIngredient(models.Model):
 
 
 class FavoriteShoppingCartModel(models.Model):
+    # Одиночные индексы не нужны: их заменяют составные
+    # (user, recipe) и (recipe, user) у наследников.
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, verbose_name='Пользователь'
+        User, on_delete=models.CASCADE, verbose_name='Пользователь',
+        db_index=False
     )
     recipe = models.ForeignKey(
-        Recipe, on_delete=models.CASCADE, verbose_name='Рецепт'
+        Recipe, on_delete=models.CASCADE, verbose_name='Рецепт',
+        db_index=False
     )
 
     class Meta:
@@ -169,6 +228,11 @@ class Favorite(FavoriteShoppingCartModel):
                 name='unqiue_favorite'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='favorite_recipe_user_idx'
+            )
+        ]
 
 
 class ShoppingCart(FavoriteShoppingCartModel):
@@ -182,3 +246,55 @@ class ShoppingCart(FavoriteShoppingCartModel):
                 name='unique_shopping_cart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='shopping_cart_recipe_user_idx'
+            )
+        ]
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        ordering = ('ingredient__name',)
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user} - {self.ingredient} - {self.amount}'
+
+
+class ResourceVersion(models.Model):
+    name = models.CharField(
+        'Ресурс',
+        max_length=settings.NAME_SIZE,
+        unique=True
+    )
+    version = models.PositiveIntegerField('Версия', default=1)
+    updated = models.DateTimeField('Изменён', auto_now=True)
+
+    class Meta:
+        ordering = ('name',)
+        verbose_name = 'Версия ресурса'
+        verbose_name_plural = 'Версии ресурсов'
+
+    def __str__(self) -> str:
+        return f'{self.name} - {self.version}'
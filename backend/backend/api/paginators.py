@@ -1,5 +1,162 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPaginator(PageNumberPagination):
+    """Постраничная пагинация с режимом курсора.
+
+    С параметром ?cursor= (пустым для первой страницы) страницы
+    выбираются без COUNT и OFFSET по ключу из текущей сортировки
+    queryset (?ordering=) с id в конце, а без неё - по
+    view.cursor_ordering. Сортировку не по полям модели, например
+    по релевантности поиска, курсор не поддерживает.
+    Ответ сохраняет ключи count, next, previous и results,
+    count в этом режиме равен None.
+    """
     page_size = 6
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+    invalid_ordering_message = 'Курсор не поддерживает сортировку {}'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.ordering = self.get_cursor_ordering(queryset, view)
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is None:
+            direction = 'next'
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            direction, values = cursor
+            queryset = self.filter_after(
+                queryset, values, reverse=direction == 'previous'
+            )
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if direction == 'previous':
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.rows = rows
+        return rows
+
+    def get_cursor_ordering(self, queryset, view):
+        ordering = list(queryset.query.order_by)
+        if not ordering:
+            return tuple(getattr(view, 'cursor_ordering', ('pk',)))
+        for field in ordering:
+            try:
+                self.get_field(queryset.model, str(field))
+            except FieldDoesNotExist:
+                raise ValidationError(
+                    self.invalid_ordering_message.format(field)
+                )
+        pk_names = {'pk', queryset.model._meta.pk.name}
+        if not pk_names & {field.lstrip('-') for field in ordering}:
+            ordering.append('pk')
+        return tuple(ordering)
+
+    def filter_after(self, queryset, values, reverse=False):
+        """Оставляет строки строго после (или до) ключа values."""
+        names = [field.lstrip('-') for field in self.ordering]
+        condition = Q()
+        for position, field in enumerate(self.ordering):
+            descending = field.startswith('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= Q(
+                **dict(zip(names[:position], values[:position])),
+                **{f'{names[position]}__{lookup}': values[position]}
+            )
+        ordering = [
+            (field[1:] if field.startswith('-') else f'-{field}')
+            if reverse else field for field in self.ordering
+        ]
+        return queryset.filter(condition).order_by(*ordering)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, values = json.loads(
+                base64.urlsafe_b64decode(encoded.encode()).decode()
+            )
+        except (binascii.Error, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            direction not in ('next', 'previous')
+            or not isinstance(values, list)
+            or len(values) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        # Значения пришли от клиента: приводим их к типам полей,
+        # чтобы в запрос не попало то, что упадёт при фильтрации.
+        try:
+            values = [
+                self.get_field(model, field).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (DjangoValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return direction, values
+
+    @staticmethod
+    def get_field(model, name):
+        name = name.lstrip('-')
+        if name == 'pk':
+            return model._meta.pk
+        return model._meta.get_field(name)
+
+    def encode_cursor(self, direction, row):
+        values = [
+            str(getattr(row, field.lstrip('-'))) for field in self.ordering
+        ]
+        encoded = base64.urlsafe_b64encode(
+            json.dumps([direction, values]).encode()
+        ).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor('next', self.rows[-1])
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous:
+            return None
+        if not self.rows:
+            url = self.request.build_absolute_uri()
+            return remove_query_param(url, self.cursor_query_param)
+        return self.encode_cursor('previous', self.rows[0])
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
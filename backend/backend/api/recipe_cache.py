@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .caches import RECIPE_CACHE
+from .models import Recipe
+
+
+def touch_recipes(**lookup):
+    """Сдвигает время изменения рецептов, чьё представление устарело.
+
+    Время изменения входит в ключ кэша, поэтому старые записи больше
+    не читаются и истекают сами.
+    """
+    Recipe.objects.filter(**lookup).update(updated=timezone.now())
+
+
+def cache_key(recipe, base_url):
+    return f'recipe:{recipe.id}:{recipe.updated.timestamp()}:{base_url}'
+
+
+def get_shared_representations(recipes, request, serialize):
+    """Одинаковое для всех пользователей представление рецептов.
+
+    Берётся из кэша одним get_many; отсутствующие сериализуются
+    вызовом serialize(recipes) и сохраняются. Адрес сайта входит
+    в ключ, так как ссылки на фото абсолютные.
+    """
+    cache = caches[RECIPE_CACHE]
+    base_url = request.build_absolute_uri('/') if request else ''
+    keys = [cache_key(recipe, base_url) for recipe in recipes]
+    cached = cache.get_many(keys)
+    missing = [
+        (key, recipe) for key, recipe in zip(keys, recipes)
+        if key not in cached
+    ]
+    if missing:
+        fresh = dict(zip(
+            [key for key, _ in missing],
+            serialize([recipe for _, recipe in missing])
+        ))
+        cache.set_many(fresh, settings.RECIPE_CACHE_TIMEOUT)
+        cached.update(fresh)
+    return [cached[key] for key in keys]
+
+
+def personalize(data, is_favorited, is_in_shopping_cart, is_subscribed):
+    """Накладывает признаки пользователя на общее представление."""
+    return {
+        **data,
+        'author': {**data['author'], 'is_subscribed': is_subscribed},
+        'is_favorited': is_favorited,
+        'is_in_shopping_cart': is_in_shopping_cart
+    }
@@ -0,0 +1,128 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector
+)
+from django.db import connection
+from django.db.models import (
+    F, FloatField, OuterRef, Q, Subquery, TextField, Value
+)
+
+from .ingredient_index import normalize
+from .models import Recipe, RecipeIngredient
+
+FTS_TABLE = 'api_recipe_fts'
+
+# Веса колонок FTS5 в bm25: название, ингредиенты, описание.
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+
+def build_search_vector():
+    """Вектор PostgreSQL: название (A), ингредиенты (B), описание (C)."""
+    from django.contrib.postgres.aggregates import StringAgg
+
+    config = settings.RECIPE_SEARCH_CONFIG
+    ingredients = RecipeIngredient.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(
+            Subquery(ingredients, output_field=TextField()),
+            weight='B', config=config
+        )
+        + SearchVector('text', weight='C', config=config)
+    )
+
+
+def fts_column(column):
+    """Для FTS5 ё и е - одна буква, как и в поиске ингредиентов."""
+    return f"REPLACE(REPLACE({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def update_search_index(recipe_ids=None):
+    """Пересчитывает поисковый индекс рецептов, без recipe_ids - всех."""
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+    if connection.vendor == 'postgresql':
+        recipes = Recipe.objects.all()
+        if recipe_ids is not None:
+            recipes = recipes.filter(id__in=recipe_ids)
+        recipes.update(search_vector=build_search_vector())
+    elif connection.vendor == 'sqlite':
+        condition, params = '', []
+        if recipe_ids is not None:
+            condition = f'IN ({", ".join(["%s"] * len(recipe_ids))})'
+            params = recipe_ids
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE}'
+                + (f' WHERE rowid {condition}' if condition else ''),
+                params
+            )
+            names = fts_column("COALESCE(GROUP_CONCAT(i.name, ' '), '')")
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+                f'SELECT r.id, {fts_column("r.name")}, {names}, '
+                f'{fts_column("r.text")} FROM api_recipe r '
+                'LEFT JOIN api_recipeingredient ri ON ri.recipe_id = r.id '
+                'LEFT JOIN api_ingredient i ON i.id = ri.ingredient_id '
+                + (f'WHERE r.id {condition} ' if condition else '')
+                + 'GROUP BY r.id',
+                params
+            )
+
+
+def remove_from_search_index(recipe_ids):
+    if connection.vendor != 'sqlite':
+        return
+    recipe_ids = list(recipe_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN '
+            f'({", ".join(["%s"] * len(recipe_ids))})',
+            recipe_ids
+        )
+
+
+def fts_query(text):
+    """Запрос FTS5: все слова обязательны, каждое ищется как префикс."""
+    return ' '.join(
+        f'"{word}"*' for word in re.findall(r'\w+', normalize(text))
+    )
+
+
+def search_recipes(queryset, text):
+    """Оставляет рецепты, подходящие под запрос, лучшие - первыми."""
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, config=settings.RECIPE_SEARCH_CONFIG)
+        return queryset.annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).filter(search_vector=query).order_by('-rank', 'id')
+    if connection.vendor == 'sqlite':
+        match = fts_query(text)
+        if not match:
+            return queryset.none()
+        weights = ', '.join(map(str, FTS_WEIGHTS))
+        # Таблица FTS5 присоединяется к рецептам, чтобы MATCH выполнялся
+        # один раз, а не для каждой строки. Оценка берётся из скрытой
+        # колонки rank: bm25() в SELECT не работает, когда Django
+        # оборачивает запрос в GROUP BY для count().
+        return queryset.extra(
+            select={'rank': f'-{FTS_TABLE}.rank'},
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE} MATCH %s',
+                f"{FTS_TABLE}.rank MATCH 'bm25({weights})'",
+                f'{Recipe._meta.db_table}.id = +{FTS_TABLE}.rowid'
+            ],
+            params=[match]
+        ).order_by('-rank', 'id')
+    return queryset.filter(
+        Q(name__icontains=text) | Q(text__icontains=text)
+    ).annotate(rank=Value(0.0, output_field=FloatField()))
@@ -1,12 +1,30 @@
-from drf_extra_fields.fields import Base64ImageField
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
 from .models import (
     Favorite, RecipeIngredient, Ingredient, Recipe, ShoppingCart, Tag
 )
+from .cook_index import cook_index
+from .fields import Base64ImageField
+from .images import get_variant_urls
+from .recipe_cache import get_shared_representations, personalize
+from .relations import (
+    FAVORITES, SHOPPING_CART, SUBSCRIPTIONS, get_user_relations
+)
+from .search import update_search_index
+from .shopping_list import track_recipe_ingredients
 from users.models import User
 
 
+def build_variant_urls(request, recipe):
+    urls = get_variant_urls(recipe)
+    if request is None or urls is None:
+        return urls
+    return {key: request.build_absolute_uri(url) for key, url in urls.items()}
+
+
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
@@ -22,14 +40,11 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, author):
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and request.user.subscriber.filter(
-                author=author
-            ).exists()
-        )
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        return get_user_relations(
+            self.context.get('request')
+        ).is_subscribed(author.id)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -55,7 +70,21 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        return self.child.represent(list(iterable))
+
+
 class ViewRecipeSerializer(serializers.ModelSerializer):
+    """Рецепт для чтения.
+
+    Всё, кроме is_favorited, is_in_shopping_cart и author.is_subscribed,
+    одинаково для всех пользователей и берётся из общего кэша по id
+    и времени изменения рецепта. Признаки пользователя берутся из
+    загрузчика связей запроса и накладываются сверху, а автор,
+    тэги и ингредиенты подгружаются только для рецептов не из кэша.
+    """
     author = UserSerializer(many=False, read_only=True)
     tags = TagSerializer(many=True)
     ingredients = RecipeIngredientSerializer(
@@ -63,6 +92,7 @@ class ViewRecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -73,31 +103,108 @@ class ViewRecipeSerializer(serializers.ModelSerializer):
             'ingredients',
             'cooking_time',
             'image',
+            'image_variants',
             'name',
             'text',
             'is_favorited',
             'is_in_shopping_cart'
         )
+        list_serializer_class = RecipeListSerializer
 
-    def get_is_favorited(self, obj):
+    def represent(self, recipes):
         request = self.context.get('request')
-        return (
-            request
-            and self.context.get('request').user.is_authenticated
-            and self.context.get('request').user.favorite.filter(
-                recipe=obj
-            ).exists()
+        relations = get_user_relations(request)
+        relations.load(FAVORITES, SHOPPING_CART, SUBSCRIPTIONS)
+        for recipe in recipes:
+            recipe.is_favorited = relations.is_favorited(recipe.id)
+            recipe.is_in_shopping_cart = relations.is_in_shopping_cart(
+                recipe.id
+            )
+            recipe.is_author_subscribed = relations.is_subscribed(
+                recipe.author_id
+            )
+        shared = get_shared_representations(
+            recipes, request, self.serialize_shared
         )
+        return [
+            personalize(
+                data, recipe.is_favorited, recipe.is_in_shopping_cart,
+                recipe.is_author_subscribed
+            ) for recipe, data in zip(recipes, shared)
+        ]
 
-    def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and request.user.shopping_cart.filter(
-                recipe=obj
-            ).exists()
+    def serialize_shared(self, recipes):
+        prefetch_related_objects(
+            recipes, 'author', 'tags', Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
         )
+        shared = []
+        for recipe in recipes:
+            recipe.author.is_subscribed = recipe.is_author_subscribed
+            shared.append(personalize(
+                super().to_representation(recipe), False, False, False
+            ))
+        return shared
+
+    def to_representation(self, recipe):
+        return self.represent([recipe])[0]
+
+    def get_image_variants(self, obj):
+        return build_variant_urls(self.context.get('request'), obj)
+
+    def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return get_user_relations(
+            self.context.get('request')
+        ).is_favorited(obj.id)
+
+    def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return get_user_relations(
+            self.context.get('request')
+        ).is_in_shopping_cart(obj.id)
+
+
+class CookRecipeSerializer(ViewRecipeSerializer):
+    """Рецепт с покрытием набора продуктов поверх общего кэша."""
+
+    def represent(self, recipes):
+        return [
+            {
+                **data,
+                'coverage': recipe.coverage,
+                'missing_count': recipe.missing_count
+            } for recipe, data in zip(recipes, super().represent(recipes))
+        ]
+
+
+class CookQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False
+    )
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.COOK_RESULTS_LIMIT,
+        default=settings.COOK_RESULTS_LIMIT
+    )
+    min_coverage = serializers.FloatField(
+        min_value=0, max_value=1, default=0
+    )
+
+
+class RecipesLimitSerializer(serializers.Serializer):
+    recipes_limit = serializers.IntegerField(min_value=0, required=False)
+
+    @classmethod
+    def get_limit(cls, request):
+        """Проверенный ?recipes_limit= или None, если он не задан."""
+        params = cls(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return params.validated_data.get('recipes_limit')
 
 
 class AddIngForRecSerializer(serializers.ModelSerializer):
@@ -115,7 +222,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         many=True
     )
     ingredients = AddIngForRecSerializer(many=True)
-    image = Base64ImageField(represent_in_base64=True)
+    image = Base64ImageField()
     cooking_time = serializers.IntegerField()
 
     class Meta:
@@ -149,15 +256,46 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data, author=author)
         self.create_ingredients(ingredients, recipe)
+        update_search_index([recipe.id])
+        cook_index.update_recipe(recipe.id)
         for tag in tags:
             recipe.tags.add(tag)
         return recipe
 
+    def update_ingredients(self, ingredients, recipe):
+        """Меняет только те строки RecipeIngredient, что изменились."""
+        amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        existing = {}
+        to_delete = []
+        for row in RecipeIngredient.objects.filter(recipe=recipe):
+            ingredient_id = row.ingredient_id
+            if ingredient_id in amounts and ingredient_id not in existing:
+                existing[ingredient_id] = row
+            else:
+                to_delete.append(row.id)
+        to_update = []
+        for ingredient_id, row in existing.items():
+            if row.amount != amounts[ingredient_id]:
+                row.amount = amounts[ingredient_id]
+                to_update.append(row)
+        RecipeIngredient.objects.filter(id__in=to_delete).delete()
+        RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            ) for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        )
+
+    @transaction.atomic
     def update(self, recipe, validated_data):
         if 'ingredients' in validated_data:
             ingredients = validated_data.pop('ingredients')
-            recipe.ingredients.clear()
-            self.create_ingredients(ingredients, recipe)
+            with track_recipe_ingredients(recipe):
+                self.update_ingredients(ingredients, recipe)
         if 'tags' in validated_data:
             tags_data = validated_data.pop('tags')
             recipe.tags.set(tags_data)
@@ -200,6 +338,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
 
 class FavoriteRecipeSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -207,9 +346,13 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
 
+    def get_image_variants(self, obj):
+        return build_variant_urls(self.context.get('request'), obj)
+
 
 class SubscriptionsSerializer(serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField()
@@ -226,27 +369,30 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
         )
 
     def get_recipes(self, author):
-        recipes = author.recipes.all()
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        limit = request.query_params.get('recipes_limit')
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(author, 'feed_recipes'):
+            return FavoriteRecipeSerializer(
+                author.feed_recipes, many=True
+            ).data
+        recipes = author.recipes.all()
+        limit = RecipesLimitSerializer.get_limit(request)
+        if limit is not None:
+            recipes = recipes[:limit]
 
         return FavoriteRecipeSerializer(recipes, many=True).data
 
     def get_is_subscribed(self, author):
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and request.user.subscriber.filter(
-                author=author
-            ).exists()
-        )
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        return get_user_relations(
+            self.context.get('request')
+        ).is_subscribed(author.id)
 
     def get_recipes_count(self, author):
+        if hasattr(author, 'recipes_count'):
+            return author.recipes_count
         return author.recipes.count()
 
 
@@ -280,3 +426,20 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         if user.shopping_cart.filter(recipe=recipe).exists():
             return serializers.ValidationError('Уже есть')
         return data
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_LIMIT
+    )
+
+    def validate_recipes(self, value):
+        recipes = Recipe.objects.in_bulk(value)
+        missing = sorted(set(value) - recipes.keys())
+        if missing:
+            raise serializers.ValidationError(
+                f'Рецепты не найдены: {", ".join(map(str, missing))}'
+            )
+        return [recipes[recipe_id] for recipe_id in dict.fromkeys(value)]
@@ -0,0 +1,165 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+
+def get_recipe_amounts(recipe_id):
+    """Возвращает {id ингредиента: количество} для рецепта."""
+    return get_recipes_amounts([recipe_id])
+
+
+def get_recipes_amounts(recipe_ids):
+    """Возвращает {id ингредиента: количество} для нескольких рецептов."""
+    return Counter(dict(
+        RecipeIngredient.objects.filter(recipe__in=recipe_ids).values(
+            'ingredient'
+        ).annotate(total=Sum('amount')).values_list(
+            'ingredient', 'total'
+        ).order_by()
+    ))
+
+
+def apply_delta(user_ids, delta):
+    """Прибавляет delta к сохранённым спискам покупок пользователей."""
+    delta = {key: value for key, value in delta.items() if value}
+    user_ids = list(user_ids)
+    if not user_ids or not delta:
+        return
+    with transaction.atomic():
+        items = ShoppingListItem.objects.select_for_update().filter(
+            user__in=user_ids, ingredient__in=delta.keys()
+        )
+        existing = {(item.user_id, item.ingredient_id): item for item in items}
+        to_create, to_update, to_delete = [], [], []
+        for user_id in user_ids:
+            for ingredient_id, amount in delta.items():
+                item = existing.get((user_id, ingredient_id))
+                if item is None:
+                    if amount > 0:
+                        to_create.append(ShoppingListItem(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=amount
+                        ))
+                    continue
+                item.amount += amount
+                if item.amount > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.id)
+        ShoppingListItem.objects.bulk_create(to_create)
+        ShoppingListItem.objects.bulk_update(to_update, ['amount'])
+        ShoppingListItem.objects.filter(id__in=to_delete).delete()
+
+
+def add_recipe(user_id, recipe_id):
+    apply_delta([user_id], get_recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    amounts = get_recipe_amounts(recipe_id)
+    apply_delta([user_id], {key: -value for key, value in amounts.items()})
+
+
+# Рецепты, чьи ингредиенты сейчас меняются внутри
+# track_recipe_ingredients: сигналы строк их не учитывают.
+_tracked = threading.local()
+
+
+def add_ingredient_amount(recipe_id, ingredient_id, amount):
+    """Переносит изменение одной строки рецепта в списки покупок."""
+    if recipe_id in getattr(_tracked, 'recipes', ()):
+        return
+    apply_delta(
+        ShoppingCart.objects.filter(recipe=recipe_id).values_list(
+            'user', flat=True
+        ),
+        {ingredient_id: amount}
+    )
+
+
+@contextmanager
+def track_recipe_ingredients(recipe):
+    """Переносит изменения ингредиентов рецепта в списки покупок.
+
+    Разница считается один раз по всему рецепту, поэтому сигналы
+    отдельных строк на это время для рецепта отключены.
+    """
+    if not hasattr(_tracked, 'recipes'):
+        _tracked.recipes = set()
+    before = get_recipe_amounts(recipe.id)
+    _tracked.recipes.add(recipe.id)
+    try:
+        yield
+    finally:
+        _tracked.recipes.discard(recipe.id)
+    after = get_recipe_amounts(recipe.id)
+    delta = {
+        key: after[key] - before[key] for key in before.keys() | after.keys()
+    }
+    apply_delta(
+        ShoppingCart.objects.filter(recipe=recipe).values_list(
+            'user', flat=True
+        ),
+        delta
+    )
+
+
+def calculate_shopping_lists(user_ids=None):
+    """Считает списки покупок заново по корзинам."""
+    # Одно условие на корзину: второй filter() по той же связи
+    # добавил бы ещё один JOIN и умножил суммы.
+    if user_ids is None:
+        queryset = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__isnull=False
+        )
+    else:
+        queryset = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__user__in=user_ids
+        )
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in queryset.values(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).values_list(
+            'recipe__shopping_cart__user', 'ingredient', 'total'
+        ).order_by()
+    }
+
+
+def rebuild_shopping_lists(user_ids=None, dry_run=False):
+    """Пересобирает сохранённые списки покупок и возвращает расхождения.
+
+    Расхождение - (user_id, ingredient_id, сохранено, должно быть).
+    С dry_run только ищет расхождения.
+    """
+    expected = calculate_shopping_lists(user_ids)
+    stored_items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        stored_items = stored_items.filter(user__in=user_ids)
+    with transaction.atomic():
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            stored_items.select_for_update().values_list(
+                'user', 'ingredient', 'amount'
+            )
+        }
+        drift = [
+            (*key, stored.get(key), expected.get(key))
+            for key in sorted(stored.keys() | expected.keys())
+            if stored.get(key) != expected.get(key)
+        ]
+        if drift and not dry_run:
+            stored_items.delete()
+            ShoppingListItem.objects.bulk_create(
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=amount
+                ) for (user_id, ingredient_id), amount in expected.items()
+            )
+    return drift
@@ -0,0 +1,240 @@
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save
+)
+from django.db import transaction
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .batch import RECIPE_COUNTERS
+from .cook_index import cook_index
+from .images import schedule_variants
+from .ingredient_index import ingredient_index
+from .models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+)
+from .recipe_cache import touch_recipes
+from .search import remove_from_search_index, update_search_index
+from .shopping_list import add_ingredient_amount, add_recipe, remove_recipe
+from .versions import (
+    INGREDIENTS, RECIPES, TAGS, bump_versions, user_resource
+)
+from users.models import Subscribe, User
+
+# Поля автора, которые попадают в представление рецепта.
+AUTHOR_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        add_recipe(instance.user_id, instance.recipe_id)
+
+
+# После удаления, а не до: при удалении рецепта каскадом строки
+# ингредиентов, удалённые раньше корзины, уже вычли себя сами.
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_ingredient_amount(sender, instance, **kwargs):
+    instance.saved_amount = None
+    if instance.pk is not None:
+        instance.saved_amount = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe', 'ingredient', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def update_shopping_lists_amount(sender, instance, **kwargs):
+    key = (instance.recipe_id, instance.ingredient_id)
+    amount = instance.amount
+    saved = getattr(instance, 'saved_amount', None)
+    if saved is not None:
+        if saved[:2] == key:
+            amount -= saved[2]
+        else:
+            add_ingredient_amount(*saved[:2], -saved[2])
+    add_ingredient_amount(*key, amount)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def remove_shopping_lists_amount(sender, instance, **kwargs):
+    add_ingredient_amount(
+        instance.recipe_id, instance.ingredient_id, -instance.amount
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(id=instance.recipe_id).update(
+            **{RECIPE_COUNTERS[sender]: F(RECIPE_COUNTERS[sender]) + 1}
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    Recipe.objects.filter(
+        id=instance.recipe_id, **{f'{RECIPE_COUNTERS[sender]}__gt': 0}
+    ).update(**{RECIPE_COUNTERS[sender]: F(RECIPE_COUNTERS[sender]) - 1})
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    if instance.image and instance.image_variants_for != instance.image.name:
+        schedule_variants(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        update_search_index([instance.id])
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, **kwargs):
+    remove_from_search_index([instance.id])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def index_recipe_ingredients(sender, instance, **kwargs):
+    update_search_index([instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def update_cook_index(sender, instance, **kwargs):
+    recipe_id = instance.id if sender is Recipe else instance.recipe_id
+    transaction.on_commit(lambda: cook_index.update_recipe(recipe_id))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_cook_index(sender, instance, **kwargs):
+    recipe_id = instance.id
+    transaction.on_commit(lambda: cook_index.remove_recipe(recipe_id))
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        update_search_index(RecipeIngredient.objects.filter(
+            ingredient=instance
+        ).values_list('recipe', flat=True).distinct())
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def touch_recipe_ingredients(sender, instance, **kwargs):
+    touch_recipes(id=instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        touch_recipes(id=instance.id)
+    elif action == 'pre_clear':
+        touch_recipes(tags=instance)
+    else:
+        touch_recipes(id__in=pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(tags=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(ingredients=instance)
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields=None,
+                         **kwargs):
+    if not created and (
+        update_fields is None or AUTHOR_FIELDS & set(update_fields)
+    ):
+        touch_recipes(author=instance)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    bump_versions(TAGS, RECIPES)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    bump_versions(INGREDIENTS, RECIPES)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_delete, sender=User)
+def bump_recipes_version(sender, **kwargs):
+    bump_versions(RECIPES)
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes_version(sender, instance, created,
+                                update_fields=None, **kwargs):
+    # Вход сохраняет last_login: версия рецептов от этого не меняется.
+    if not created and (
+        update_fields is None or AUTHOR_FIELDS & set(update_fields)
+    ):
+        bump_versions(RECIPES)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_versions(RECIPES)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def bump_user_version(sender, instance, **kwargs):
+    bump_versions(user_resource(instance.user_id))
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    key = instance.key
+    token_cache.invalidate(key)
+    transaction.on_commit(lambda: token_cache.invalidate(key))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_tokens(sender, instance, **kwargs):
+    # Повторно после коммита: иначе параллельный запрос может успеть
+    # закэшировать пользователя из ещё не обновлённой строки.
+    user_id = instance.id
+    token_cache.invalidate_user(user_id)
+    transaction.on_commit(lambda: token_cache.invalidate_user(user_id))
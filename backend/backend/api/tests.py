@@ -0,0 +1,575 @@
+import base64
+import json
+from itertools import product
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import token_cache
+from .indexes import explain, get_plan_cases, seed_plan_data
+from .models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+)
+from .paginators import CustomPaginator
+from .shopping_list import calculate_shopping_lists, rebuild_shopping_lists
+from .utils import rolled_back
+from users.models import Subscribe, User
+
+
+class APITestCase(TestCase):
+    """Общие данные: авторы, тэги и рецепты с ингредиентами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}', email=f'author{number}@mail.ru',
+                first_name='Имя', last_name='Фамилия', password='pass12345!'
+            ) for number in range(3)
+        ]
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@mail.ru',
+            first_name='Имя', last_name='Фамилия', password='pass12345!'
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тэг {number}', color=f'#00000{number}',
+                slug=f'tag{number}'
+            ) for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'сахар', 'яйцо', 'молоко')
+        ]
+        cls.recipes = []
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.authors[number % 3],
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe/images/test.png'
+            )
+            recipe.tags.set([cls.tags[number % 3]])
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe=recipe, ingredient=cls.ingredients[number % 4],
+                    amount=100
+                ),
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[(number + 1) % 4],
+                    amount=50
+                ),
+            ])
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[:4]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[2:6]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Subscribe.objects.create(user=cls.user, author=cls.authors[0])
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    def assert_list_queries(self, client, queries):
+        for page_size in (2, 10):
+            with self.subTest(page_size=page_size):
+                for cache in caches.all():
+                    cache.clear()
+                with mock.patch.object(
+                    CustomPaginator, 'page_size', page_size
+                ), self.assertNumQueries(queries):
+                    response = client.get('/api/recipes/')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), page_size)
+
+    def test_authenticated(self):
+        self.assert_list_queries(self.client, 6)
+
+    def test_anonymous(self):
+        self.assert_list_queries(self.anonymous, 5)
+
+
+class ShoppingListTest(APITestCase):
+    """Пересчёт списков покупок по корзинам."""
+
+    def test_calculate_for_users(self):
+        second = self.authors[1]
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=second, recipe=recipe)
+            for recipe in self.recipes[2:4]
+        ])
+        expected = calculate_shopping_lists()
+        self.assertEqual(
+            calculate_shopping_lists([self.user.id, second.id]), expected
+        )
+        self.assertEqual(
+            calculate_shopping_lists([second.id]),
+            {key: value for key, value in expected.items()
+             if key[0] == second.id}
+        )
+        self.assertEqual(
+            expected[(self.user.id, self.ingredients[3].id)], 150
+        )
+
+    def assert_in_sync(self):
+        self.assertEqual(rebuild_shopping_lists(dry_run=True), [])
+
+    def test_api_changes(self):
+        recipe = self.recipes[8]
+        ids = [recipe.id for recipe in self.recipes[4:10]]
+        author = APIClient()
+        author.force_authenticate(recipe.author)
+        for method, url, data, status in (
+            ('post', f'/api/recipes/{recipe.id}/shopping_cart/', None, 201),
+            ('delete', f'/api/recipes/{recipe.id}/shopping_cart/', None, 204),
+            ('post', '/api/recipes/shopping_cart/batch/',
+             {'recipes': ids}, 201),
+            ('delete', '/api/recipes/shopping_cart/batch/',
+             {'recipes': ids[:3]}, 204),
+            ('patch', f'/api/recipes/{recipe.id}/', {
+                'ingredients': [
+                    {'id': self.ingredients[0].id, 'amount': 5},
+                    {'id': self.ingredients[1].id, 'amount': 500},
+                ],
+                'tags': [self.tags[0].id]
+            }, 200),
+            ('delete', '/api/recipes/shopping_cart/', None, 204),
+        ):
+            client = author if method == 'patch' else self.client
+            with self.subTest(method=method, url=url):
+                response = getattr(client, method)(url, data, format='json')
+                self.assertEqual(response.status_code, status)
+                self.assert_in_sync()
+        self.assertFalse(self.user.shopping_list.exists())
+
+    def test_ingredient_rows(self):
+        recipe = self.recipes[2]
+        row = RecipeIngredient.objects.filter(recipe=recipe).first()
+        row.amount = 70
+        row.save()
+        self.assert_in_sync()
+        row.ingredient = self.ingredients[0]
+        row.save()
+        self.assert_in_sync()
+        row.recipe = self.recipes[8]
+        row.save()
+        self.assert_in_sync()
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.ingredients[3], amount=7
+        )
+        self.assert_in_sync()
+        RecipeIngredient.objects.filter(recipe=recipe).first().delete()
+        self.assert_in_sync()
+
+    def test_delete_recipe(self):
+        self.recipes[3].delete()
+        self.assert_in_sync()
+        self.assertEqual(self.user.shopping_list.get(
+            ingredient=self.ingredients[3]
+        ).amount, 50)
+
+
+class ConditionalGetTest(APITestCase):
+    """Ответы 304 по ETag и Last-Modified."""
+
+    def test_not_modified_since(self):
+        response = self.anonymous.get('/api/tags/')
+        response = self.anonymous.get(
+            '/api/tags/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_tags_after_change(self):
+        response = self.anonymous.get('/api/tags/')
+        self.assertEqual(len(response.data), len(self.tags))
+        Tag.objects.create(name='Новый', color='#111111', slug='new')
+        response = self.anonymous.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), len(self.tags) + 1)
+
+    def test_login_keeps_recipe_etag(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        etag = self.anonymous.get(url)['ETag']
+        response = self.anonymous.post('/api/auth/token/login/', {
+            'email': self.user.email, 'password': 'pass12345!'
+        })
+        self.assertEqual(response.status_code, 200)
+        response = self.anonymous.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_of_other_object(self):
+        for url, first, second in (
+            ('/api/recipes/{}/', self.recipes[0].id, self.recipes[1].id),
+            ('/api/tags/{}/', self.tags[0].id, self.tags[1].id),
+        ):
+            with self.subTest(url=url):
+                etag = self.client.get(url.format(first))['ETag']
+                response = self.client.get(
+                    url.format(second), HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['id'], second)
+
+    def test_missing_object_with_etag(self):
+        response = self.client.get(f'/api/recipes/{self.recipes[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            '/api/recipes/0/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeFilterTest(APITestCase):
+    """Фильтры списка рецептов в любых сочетаниях."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes[0].tags.add(cls.tags[1])
+        cls.favorites = {recipe.id for recipe in cls.recipes[:4]}
+        cls.cart = {recipe.id for recipe in cls.recipes[2:6]}
+
+    def get_ids(self, client, params):
+        with mock.patch.object(CustomPaginator, 'page_size', 100):
+            response = client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def expected_ids(self, tags, author, is_favorited, is_in_shopping_cart):
+        return sorted(
+            recipe.id for recipe in self.recipes
+            if (not tags or {tag.slug for tag in recipe.tags.all()} & tags)
+            and (author is None or recipe.author_id == author)
+            and (not is_favorited or recipe.id in self.favorites)
+            and (not is_in_shopping_cart or recipe.id in self.cart)
+        )
+
+    def test_combinations(self):
+        tag_options = (
+            set(), {self.tags[0].slug}, {self.tags[0].slug, self.tags[1].slug}
+        )
+        author_options = (None, self.authors[0].id)
+        for tags, author, is_favorited, is_in_shopping_cart in product(
+            tag_options, author_options, (False, True), (False, True)
+        ):
+            params = {'tags': sorted(tags)}
+            if author is not None:
+                params['author'] = author
+            if is_favorited:
+                params['is_favorited'] = 1
+            if is_in_shopping_cart:
+                params['is_in_shopping_cart'] = 1
+            with self.subTest(**params):
+                ids = self.get_ids(self.client, params)
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(sorted(ids), self.expected_ids(
+                    tags, author, is_favorited, is_in_shopping_cart
+                ))
+
+    def test_multiple_tags_without_duplicates(self):
+        ids = self.get_ids(self.client, {
+            'tags': [self.tags[0].slug, self.tags[1].slug]
+        })
+        self.assertEqual(ids.count(self.recipes[0].id), 1)
+        self.assertEqual(len(ids), 8)
+
+    def test_anonymous_user_relations(self):
+        for params in (
+            {'is_favorited': 1},
+            {'is_in_shopping_cart': 1},
+            {'is_favorited': 1, 'tags': self.tags[0].slug},
+        ):
+            with self.subTest(**params):
+                self.assertEqual(self.get_ids(self.anonymous, params), [])
+        self.assertEqual(
+            len(self.get_ids(self.anonymous, {'is_favorited': 0})),
+            len(self.recipes)
+        )
+
+
+class UserQueriesTest(APITestCase):
+    """Список и карточка пользователей без запросов на каждого."""
+
+    def assert_users(self, client, url, queries, subscribed):
+        with self.assertNumQueries(queries):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        users = response.data.get('results', [response.data])
+        self.assertTrue(users)
+        self.assertEqual(
+            {user['id'] for user in users if user['is_subscribed']},
+            subscribed & {user['id'] for user in users}
+        )
+
+    def test_list_and_retrieve(self):
+        subscribed = {self.authors[0].id}
+        for name, client, expected in (
+            ('authenticated', self.client, subscribed),
+            ('anonymous', self.anonymous, set()),
+        ):
+            with self.subTest(client=name):
+                self.assert_users(client, '/api/users/', 2, expected)
+                self.assert_users(client, '/api/users/?cursor=', 1, expected)
+                self.assert_users(
+                    client, f'/api/users/{self.authors[0].id}/', 1, expected
+                )
+
+
+class SubscriptionsTest(APITestCase):
+    """Подписки с ограничением числа рецептов."""
+
+    def test_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results'][0]['recipes']), 2)
+        author = self.authors[1]
+        response = self.client.post(
+            f'/api/users/{author.id}/subscribe/?recipes_limit=1'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['recipes']), 1)
+
+    def test_invalid_recipes_limit(self):
+        for limit in ('abc', '-1'):
+            with self.subTest(limit=limit):
+                response = self.client.get(
+                    '/api/users/subscriptions/', {'recipes_limit': limit}
+                )
+                self.assertEqual(response.status_code, 400)
+                response = self.client.post(
+                    f'/api/users/{self.authors[2].id}/subscribe/'
+                    f'?recipes_limit={limit}'
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Subscribe.objects.filter(
+            user=self.user, author=self.authors[2]
+        ).exists())
+
+
+class CursorPaginationTest(APITestCase):
+    """Постраничный вывод по курсору."""
+
+    def walk(self, url):
+        ids, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data['count'])
+            ids += [item['id'] for item in response.data['results']]
+            pages.append(response.data)
+            url = response.data['next']
+        return ids, pages
+
+    def test_walk_forward_and_back(self):
+        ids, pages = self.walk('/api/recipes/?cursor=')
+        self.assertEqual(ids, [recipe.id for recipe in self.recipes])
+        self.assertIsNone(pages[0]['previous'])
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [item['id'] for item in pages[-2]['results']]
+        )
+
+    def test_active_ordering(self):
+        for recipe in self.recipes:
+            Recipe.objects.filter(id=recipe.id).update(
+                favorites_count=recipe.id % 4
+            )
+        for ordering in ('-favorites_count', 'favorites_count,-pub_date'):
+            with self.subTest(ordering=ordering):
+                ids, pages = self.walk(
+                    f'/api/recipes/?cursor=&ordering={ordering}'
+                )
+                expected = list(Recipe.objects.order_by(
+                    *ordering.split(','), 'pk'
+                ).values_list('id', flat=True))
+                self.assertEqual(ids, expected)
+                response = self.client.get(pages[-1]['previous'])
+                self.assertEqual(
+                    [item['id'] for item in response.data['results']],
+                    [item['id'] for item in pages[-2]['results']]
+                )
+
+    def test_search_rank_with_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=&search=Рецепт')
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_cursor(self):
+        for cursor in (
+            'not base64!',
+            ['sideways', ['2020-01-01', '1']],
+            ['next', ['2020-01-01']],
+            ['next', 'x'],
+            ['next', ['x', 'y']],
+            ['next', [{}, []]],
+            ['next', [None, '1']],
+        ):
+            if not isinstance(cursor, str):
+                cursor = base64.urlsafe_b64encode(
+                    json.dumps(cursor).encode()
+                ).decode()
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/recipes/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
+
+
+class QueryPlansTest(TestCase):
+    """Запросы API используют свои индексы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.recipe_id = seed_plan_data(300)
+
+    def test_indexes(self):
+        for title, queryset, index in get_plan_cases(
+            self.user, self.recipe_id
+        ):
+            with self.subTest(title):
+                self.assertIn(index, explain(queryset))
+
+
+class BatchTest(APITestCase):
+    """Пакетное добавление и удаление избранного и корзины."""
+
+    def assert_consistent(self, model, counter):
+        counts = dict(model.objects.values('recipe').annotate(
+            total=Count('id')
+        ).values_list('recipe', 'total').order_by())
+        self.assertEqual(
+            dict(Recipe.objects.values_list('id', counter)),
+            {recipe.id: counts.get(recipe.id, 0) for recipe in self.recipes}
+        )
+        self.assertEqual(rebuild_shopping_lists(dry_run=True), [])
+
+    def test_add_and_remove(self):
+        ids = [recipe.id for recipe in self.recipes]
+        for model, url, counter in (
+            (Favorite, 'favorite', 'favorites_count'),
+            (ShoppingCart, 'shopping_cart', 'in_carts_count'),
+        ):
+            with self.subTest(url=url):
+                response = self.client.post(
+                    f'/api/recipes/{url}/batch/',
+                    {'recipes': ids[3:8] + ids[3:5]}, format='json'
+                )
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.data), 5)
+                self.assert_consistent(model, counter)
+                response = self.client.delete(
+                    f'/api/recipes/{url}/batch/',
+                    {'recipes': ids[:6]}, format='json'
+                )
+                self.assertEqual(response.status_code, 204)
+                self.assertEqual(
+                    set(model.objects.filter(user=self.user).values_list(
+                        'recipe', flat=True
+                    )), set(ids[6:8])
+                )
+                self.assert_consistent(model, counter)
+
+    def test_invalid_batches(self):
+        for recipes in ([], [0, self.recipes[0].id], 'x'):
+            with self.subTest(recipes=recipes):
+                response = self.client.post(
+                    '/api/recipes/favorite/batch/', {'recipes': recipes},
+                    format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+        response = self.anonymous.post(
+            '/api/recipes/favorite/batch/',
+            {'recipes': [self.recipes[0].id]}, format='json'
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_single_changes_take_user_lock(self):
+        url = f'/api/recipes/{self.recipes[8].id}/shopping_cart/'
+        for method, status in (('post', 201), ('delete', 204)):
+            with self.subTest(method=method), mock.patch(
+                'api.views.lock_user'
+            ) as lock_user:
+                response = getattr(self.client, method)(url)
+                self.assertEqual(response.status_code, status)
+                lock_user.assert_called_once_with(self.user.id)
+
+
+class SearchVectorTest(APITestCase):
+    """search_vector не читается вне поиска."""
+
+    def test_not_selected(self):
+        recipe = self.recipes[0]
+        with CaptureQueriesContext(connection) as queries:
+            for url in (
+                '/api/recipes/',
+                f'/api/recipes/{recipe.id}/',
+                '/api/users/subscriptions/?recipes_limit=2',
+                '/api/recipes/cook/?ingredients='
+                f'{self.ingredients[0].id}',
+                '/api/recipes/?search=Рецепт',
+            ):
+                self.assertEqual(self.client.get(url).status_code, 200)
+            response = self.client.post(
+                '/api/recipes/favorite/batch/',
+                {'recipes': [recipe.id for recipe in self.recipes[4:8]]},
+                format='json'
+            )
+            self.assertEqual(response.status_code, 201)
+        selects = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+        ]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertNotIn('search_vector', sql)
+
+
+class RolledBackTest(TestCase):
+    """Данные из rolled_back не остаются в базе."""
+
+    def test_rollback(self):
+        with rolled_back():
+            Tag.objects.create(name='Временный', color='#222222', slug='tmp')
+            self.assertTrue(Tag.objects.filter(slug='tmp').exists())
+        self.assertFalse(Tag.objects.filter(slug='tmp').exists())
+
+
+class CacheStatsTest(APITestCase):
+    """Отчёт о кэшах включает кэш токенов."""
+
+    def test_token_cache_row(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@mail.ru', password='pass12345!',
+            first_name='Имя', last_name='Фамилия'
+        )
+        token_cache.clear()
+        token_cache.hits = token_cache.misses = 0
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=admin)}'
+        )
+        client.get('/api/cache-stats/')
+        response = client.get('/api/cache-stats/')
+        self.assertEqual(response.status_code, 200)
+        rows = {row['name']: row for row in response.data}
+        self.assertEqual(rows['tokens']['misses'], 1)
+        self.assertEqual(rows['tokens']['hits'], 1)
+        self.assertEqual(rows['tokens']['hit_rate'], 0.5)
@@ -2,9 +2,9 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
-    APISubscribe,
+    APISubscribe, CacheStats,
     IngredientViewSet, RecipeViewSet,
-    ListSubscriptions, TagViewSet
+    ListSubscriptions, TagViewSet, UserViewSet
 )
 
 
@@ -14,10 +14,10 @@ router = DefaultRouter()
 router.register(r'recipes', RecipeViewSet, basename='recipes')
 router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
+router.register(r'users', UserViewSet, basename='users')
 
 
 urlpatterns = [
-    path('', include(router.urls)),
     path(
         'users/<int:id>/subscribe/', APISubscribe.as_view(), name='subscribe'
     ),
@@ -25,5 +25,7 @@ urlpatterns = [
         'users/subscriptions/',
         ListSubscriptions.as_view(),
         name='subscriptions'
-    )
+    ),
+    path('cache-stats/', CacheStats.as_view(), name='cache-stats'),
+    path('', include(router.urls))
 ]
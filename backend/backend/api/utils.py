@@ -1,39 +1,178 @@
+import csv
+import hashlib
 import io
+import math
+import os
+from contextlib import contextmanager
+from itertools import islice
 
-from django.http import FileResponse
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfbase import pdfmetrics
 
+from .caches import SHOPPING_LIST_CACHE
+from .models import Recipe
 
-def get_shopping_list(self, shopping_list):
-    font = 'DejaVuSerif'
-    pdfmetrics.registerFont(
-        TTFont('DejaVuSerif', 'DejaVuSerif.ttf', 'UTF-8'))
+
+FONT = 'DejaVuSerif'
+
+SHOPPING_LIST_TITLE = 'Список покупок.'
+
+SHOPPING_LIST_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+
+
+def register_fonts():
+    pdfmetrics.registerFont(TTFont(
+        FONT, os.path.join(settings.BASE_DIR, 'DejaVuSerif.ttf'), 'UTF-8'
+    ))
+
+
+def format_ingredient(number, ingredient):
+    return (
+        f'{number}.  {ingredient["name"]} - {ingredient["amount"]} '
+        f'{ingredient["unit"]}'
+    )
+
+
+def render_pdf(shopping_list):
     buffer = io.BytesIO()
     pdf_file = canvas.Canvas(buffer)
-    pdf_file.setFont(font, 24)
+    pdf_file.setFont(FONT, 24)
     pdf_file.drawString(
         150,
         800,
-        'Список покупок.'
+        SHOPPING_LIST_TITLE
     )
-    pdf_file.setFont(font, 14)
+    pdf_file.setFont(FONT, 14)
     from_bottom = 750
     for number, ingredient in enumerate(shopping_list, start=1):
         pdf_file.drawString(
             50,
             from_bottom,
-            f'{number}.  {ingredient["name"]} - {ingredient["amount"]} '
-            f'{ingredient["unit"]}'
+            format_ingredient(number, ingredient)
         )
         from_bottom -= 20
         if from_bottom <= 50:
             from_bottom = 800
             pdf_file.showPage()
-            pdf_file.setFont(font, 14)
+            pdf_file.setFont(FONT, 14)
     pdf_file.showPage()
     pdf_file.save()
-    buffer.seek(0)
-    return FileResponse(buffer, as_attachment=True,
-                        filename='shopping_list.pdf')
+    return buffer.getvalue()
+
+
+def build_txt(shopping_list):
+    buffer = io.StringIO()
+    buffer.write(f'{SHOPPING_LIST_TITLE}\n')
+    for number, ingredient in enumerate(shopping_list, start=1):
+        buffer.write(f'{format_ingredient(number, ingredient)}\n')
+    return buffer.getvalue().encode()
+
+
+def build_csv(shopping_list):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(SHOPPING_LIST_HEADER)
+    writer.writerows(
+        (ingredient['name'], ingredient['amount'], ingredient['unit'])
+        for ingredient in shopping_list
+    )
+    return buffer.getvalue().encode()
+
+
+SHOPPING_LIST_RENDERERS = {
+    'pdf': (render_pdf, 'application/pdf'),
+    'txt': (build_txt, 'text/plain; charset=utf-8'),
+    'csv': (build_csv, 'text/csv; charset=utf-8'),
+}
+
+
+def get_shopping_list(request, shopping_list, file_format='pdf'):
+    """Отдаёт список покупок, кэшируя файл по хэшу его содержимого.
+
+    Одинаковые списки получают один и тот же ETag, поэтому при
+    совпадении If-None-Match возвращается 304 без рендеринга.
+    """
+    render, content_type = SHOPPING_LIST_RENDERERS[file_format]
+    shopping_list = list(shopping_list)
+    digest = hashlib.sha256(repr((file_format, [
+        (ingredient['name'], ingredient['unit'], ingredient['amount'])
+        for ingredient in shopping_list
+    ])).encode()).hexdigest()
+    etag = f'"{digest}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cache = caches[SHOPPING_LIST_CACHE]
+        key = f'shopping_list:{digest}'
+        content = cache.get(key)
+        if content is None:
+            content = render(shopping_list)
+            cache.set(key, content, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_format}"'
+        )
+    response['ETag'] = etag
+    return response
+
+
+def bulk_create_in_batches(model, objs, batch_size):
+    """bulk_create по частям, не собирая все объекты в памяти.
+
+    batch_size в bulk_create не подходит: на Django 2.2 он отменяет
+    ограничение SQLite на число строк в одном INSERT.
+    """
+    objs = iter(objs)
+    batch = list(islice(objs, batch_size))
+    while batch:
+        model.objects.bulk_create(batch)
+        batch = list(islice(objs, batch_size))
+
+
+@contextmanager
+def rolled_back():
+    """Транзакция, которая всегда откатывается.
+
+    Для команд, которые создают данные только на время замеров.
+    """
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def prefetch_limited_recipes(authors, limit=None):
+    """Подгружает авторам не больше limit рецептов одним запросом."""
+    authors = {author.id: author for author in authors}
+    for author in authors.values():
+        author.feed_recipes = []
+    if not authors:
+        return
+    ranked = Recipe.objects.filter(author__in=authors.keys()).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author')],
+            order_by=[F('pub_date').asc(), F('id').asc()]
+        )
+    ).order_by()
+    sql, params = ranked.query.sql_with_params()
+    sql = f'SELECT * FROM ({sql}) ranked'
+    if limit is not None:
+        sql += ' WHERE ranked.row_number <= %s'
+        params += (limit,)
+    sql += ' ORDER BY ranked.author_id, ranked.row_number'
+    for recipe in Recipe.objects.raw(sql, params):
+        authors[recipe.author_id].feed_recipes.append(recipe)
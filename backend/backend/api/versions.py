@@ -0,0 +1,32 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ResourceVersion
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+RECIPES = 'recipes'
+
+
+def user_resource(user_id):
+    """Версия связей пользователя: избранное, корзина и подписки."""
+    return f'user:{user_id}'
+
+
+def bump_versions(*names):
+    for name in names:
+        updated = ResourceVersion.objects.filter(name=name).update(
+            version=F('version') + 1, updated=timezone.now()
+        )
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                ResourceVersion.objects.create(name=name)
+        except IntegrityError:
+            bump_versions(name)
+
+
+def get_versions(*names):
+    return list(ResourceVersion.objects.filter(name__in=names))
@@ -1,28 +1,47 @@
-from django.db.models import F, Sum
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Count, Exists, F, OuterRef, Value
+)
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import filters, status, viewsets, views
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import (
+    AllowAny, IsAdminUser, IsAuthenticated
+)
 from rest_framework.response import Response
 
-from .filters import IngredientFilter, RecipeFilter
+from .authentication import get_token_cache_stats
+from .batch import add_recipes, lock_user, remove_recipes
+from .caches import REFERENCE_CACHE, get_cache_stats
+from .cook_index import cook_index
+from .filters import RecipeFilter
+from .ingredient_index import ingredient_index
+from .mixins import ConditionalGetMixin
 from .models import (
-    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+    Favorite, Ingredient, Recipe, ShoppingCart, ShoppingListItem, Tag
 )
 from .paginators import CustomPaginator
 from .permissions import AuthorOrReadOnly
+from .renderers import (
+    CSVRenderer, PDFRenderer, PlainTextRenderer, ShoppingListNegotiation
+)
 from .serializers import (
+    CookQuerySerializer, CookRecipeSerializer,
     CreateRecipeSerializer, FavoriteRecipeSerializer,
-    FavoriteSerializer, IngredientSerializer,
-    ShoppingCartSerializer, SubscriptionsSerializer,
+    FavoriteSerializer, IngredientSerializer, RecipeBatchSerializer,
+    RecipesLimitSerializer, ShoppingCartSerializer, SubscriptionsSerializer,
     TagSerializer, ViewRecipeSerializer
 )
-from .utils import get_shopping_list
+from .utils import get_shopping_list, prefetch_limited_recipes
+from .versions import INGREDIENTS, RECIPES, TAGS, user_resource
 from users.models import Subscribe, User
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ Обрабатывает запросы к рецептам"""
     queryset = Recipe.objects.all()
     permission_classes = (AuthorOrReadOnly,)
@@ -31,6 +50,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = RecipeFilter
     filterset_field = ('tags', 'author')
     ordering_field = ('-pub_date',)
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
+    cursor_ordering = ('pub_date', 'id')
+
+    def get_versioned_resources(self, request):
+        if request.user.is_authenticated:
+            return (RECIPES, user_resource(request.user.id))
+        return (RECIPES,)
+
+    def is_private(self, request):
+        return request.user.is_authenticated
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -40,8 +69,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def post_req(self, request, id, model, serializer):
         user = request.user
         serializer = serializer(data={'user': user.id, 'recipe': id})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # Та же блокировка, что у пакетов: иначе пакет посчитает
+        # рецепт, добавленный здесь между его проверкой и вставкой.
+        with transaction.atomic():
+            lock_user(user.id)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
         return Response(
             FavoriteRecipeSerializer(
                 get_object_or_404(Recipe, id=id), context={'request': request}
@@ -49,20 +82,72 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
     def delete_req(self, request, id, model):
-        get_object_or_404(
-            model, user=request.user, recipe=get_object_or_404(Recipe, id=id)
-        ).delete()
+        with transaction.atomic():
+            lock_user(request.user.id)
+            get_object_or_404(
+                model, user=request.user,
+                recipe=get_object_or_404(Recipe, id=id)
+            ).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(methods=['GET'], permission_classes=(AllowAny,), detail=False)
+    def post_batch_req(self, request, model):
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        add_recipes(model, request.user, [recipe.id for recipe in recipes])
+        return Response(
+            FavoriteRecipeSerializer(
+                recipes, many=True, context={'request': request}
+            ).data, status=status.HTTP_201_CREATED
+        )
+
+    def delete_batch_req(self, request, model):
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        remove_recipes(model, request.user, [
+            recipe.id for recipe in serializer.validated_data['recipes']
+        ])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        methods=['GET'], permission_classes=(AllowAny,), detail=False,
+        renderer_classes=(PDFRenderer, PlainTextRenderer, CSVRenderer),
+        content_negotiation_class=ShoppingListNegotiation
+    )
     def download_shopping_cart(self, request):
         user = request.user
-        shopping_list = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=user).values(
+        shopping_list = ShoppingListItem.objects.filter(user=user).values(
+            'amount',
             name=F('ingredient__name'),
             unit=F('ingredient__measurement_unit')
-        ).annotate(amount=Sum('amount')).order_by()
-        return get_shopping_list(self, shopping_list)
+        )
+        return get_shopping_list(
+            request, shopping_list, request.accepted_renderer.format
+        )
+
+    @action(methods=['GET'], permission_classes=(AllowAny,), detail=False)
+    def cook(self, request):
+        params = CookQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        matches = cook_index.match(
+            params.validated_data['ingredients'],
+            limit=params.validated_data['limit'],
+            min_coverage=params.validated_data['min_coverage']
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        results = []
+        for recipe_id, coverage, missing_count in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.coverage = round(coverage, 4)
+            recipe.missing_count = missing_count
+            results.append(recipe)
+        return Response(CookRecipeSerializer(
+            results, many=True, context={'request': request}
+        ).data)
 
     @action(methods=['POST'], detail=True)
     def favorite(self, request, pk):
@@ -72,6 +157,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def delete_favorite(self, request, pk):
         return self.delete_req(request, pk, Favorite)
 
+    @action(
+        methods=['POST'], permission_classes=(IsAuthenticated,),
+        detail=False, url_path='favorite/batch'
+    )
+    def favorite_batch(self, request):
+        return self.post_batch_req(request, Favorite)
+
+    @favorite_batch.mapping.delete
+    def delete_favorite_batch(self, request):
+        return self.delete_batch_req(request, Favorite)
+
     @action(methods=['POST'], detail=True)
     def shopping_cart(self, request, pk):
         return self.post_req(request, pk, ShoppingCart, ShoppingCartSerializer)
@@ -80,30 +176,107 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def delete_shopping_cart(self, request, pk):
         return self.delete_req(request, pk, ShoppingCart)
 
+    @action(
+        methods=['POST'], permission_classes=(IsAuthenticated,),
+        detail=False, url_path='shopping_cart/batch'
+    )
+    def shopping_cart_batch(self, request):
+        return self.post_batch_req(request, ShoppingCart)
+
+    @shopping_cart_batch.mapping.delete
+    def delete_shopping_cart_batch(self, request):
+        return self.delete_batch_req(request, ShoppingCart)
+
+    @action(
+        methods=['DELETE'], permission_classes=(IsAuthenticated,),
+        detail=False, url_path='shopping_cart'
+    )
+    def clear_shopping_cart(self, request):
+        remove_recipes(ShoppingCart, request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (AllowAny,)
     http_method_names = ['get']
+    versioned_resources = (TAGS,)
+
+    def cached_list(self, request):
+        # Версия в ключе: после изменения тэгов каждый процесс читает
+        # новый ключ, а не свою старую копию под новым ETag.
+        version = self.resource_versions.get(TAGS, 0)
+        return Response(caches[REFERENCE_CACHE].get_or_set(
+            f'{TAGS}:{version}', lambda: list(self.get_serializer(
+                self.filter_queryset(self.get_queryset()), many=True
+            ).data)
+        ))
+
+    def list(self, request):
+        return self.conditional_get(request, self.cached_list)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = (AllowAny,)
     http_method_names = ['get']
-    filter_backends = (IngredientFilter,)
-    search_fields = ('^name',)
+    versioned_resources = (INGREDIENTS,)
+
+    def search(self, request):
+        name = request.query_params.get('name')
+        if name is None:
+            return Response(ingredient_index.search())
+        return Response(ingredient_index.search(
+            name, settings.INGREDIENT_SEARCH_LIMIT
+        ))
+
+    def list(self, request):
+        return self.conditional_get(request, self.search)
+
+
+class UserViewSet(DjoserUserViewSet):
+    """Пользователи djoser с подпиской, посчитанной в том же запросе.
+
+    Для списка и карточки пользователя is_subscribed считается
+    подзапросом EXISTS и читаются только выводимые поля, поэтому
+    страница пользователей - это запрос COUNT и запрос самой страницы,
+    а с ?cursor= - один запрос.
+    """
+    pagination_class = CustomPaginator
+    cursor_ordering = ('username', 'id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        user = self.request.user
+        if user.is_authenticated:
+            is_subscribed = Exists(
+                Subscribe.objects.filter(user=user, author=OuterRef('pk'))
+            )
+        else:
+            is_subscribed = Value(False, output_field=BooleanField())
+        return queryset.annotate(is_subscribed=is_subscribed).only(
+            'id', 'username', 'email', 'first_name', 'last_name'
+        )
 
 
 class ListSubscriptions(views.APIView, CustomPaginator):
+    cursor_ordering = ('username', 'id')
+
     def get(self, request):
         user = request.user
-        queryset = User.objects.filter(subscribing__user=user)
+        limit = RecipesLimitSerializer.get_limit(request)
+        queryset = User.objects.filter(subscribing__user=user).annotate(
+            recipes_count=Count('recipes'),
+            is_subscribed=Value(True, output_field=BooleanField())
+        )
         paginated = self.paginate_queryset(queryset, request, view=self)
+        prefetch_limited_recipes(paginated, limit)
         return self.get_paginated_response(
             SubscriptionsSerializer(
                 paginated, context={'request': request}, many=True
@@ -114,6 +287,7 @@ class ListSubscriptions(views.APIView, CustomPaginator):
 class APISubscribe(views.APIView):
     def post(self, request, id):
         user = request.user
+        RecipesLimitSerializer.get_limit(request)
         author = get_object_or_404(User, id=id)
         Subscribe.objects.get_or_create(user=user, author=author)
         serializer = SubscriptionsSerializer(author, context={'request':
@@ -125,3 +299,12 @@ class APISubscribe(views.APIView):
             Subscribe, user=request.user, author=get_object_or_404(User, id=id)
         ).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CacheStats(views.APIView):
+    """Попадания и промахи по каждому кэшу и кэшу токенов
+    в процессе, принявшем запрос."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_cache_stats() + [get_token_cache_stats()])
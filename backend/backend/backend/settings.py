@@ -32,6 +32,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -74,6 +75,50 @@ else:
     }
 
 
+# Кэши: CACHE_BACKEND - locmem, file, db или путь к классу бэкенда;
+# CACHE_<ИМЯ>_BACKEND переопределяет его для одного кэша. Для file
+# CACHE_LOCATION - каталог (в нём подкаталог на каждый кэш), для db -
+# префикс таблиц (таблицы создаёт createcachetable), для остальных
+# бэкендов - адрес сервера.
+CACHE_BACKENDS = {
+    'locmem': 'api.caches.LocMemCache',
+    'file': 'api.caches.FileBasedCache',
+    'db': 'api.caches.DatabaseCache',
+}
+
+CACHE_NAMES = ('default', 'recipes', 'shopping_lists', 'reference', 'rate')
+
+
+def get_cache_config(name):
+    backend = os.getenv(
+        f'CACHE_{name.upper()}_BACKEND',
+        default=os.getenv('CACHE_BACKEND', default='locmem')
+    )
+    location = os.getenv('CACHE_LOCATION')
+    if backend == 'locmem':
+        location = name
+    elif backend == 'file':
+        location = os.path.join(
+            location or os.path.join(BASE_DIR, 'cache'), name
+        )
+    elif backend == 'db':
+        location = f'{location or "cache"}_{name}'
+    config = {
+        'BACKEND': CACHE_BACKENDS.get(backend, backend),
+        'LOCATION': location or '',
+        'KEY_PREFIX': name,
+    }
+    if backend in CACHE_BACKENDS:
+        config['OPTIONS'] = {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=10000))
+        }
+    return config
+
+
+CACHES = {name: get_cache_config(name) for name in CACHE_NAMES}
+
+CACHE_STATS_FLUSH_INTERVAL = 10
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -95,7 +140,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
@@ -139,6 +184,19 @@ ALLOWED_SLUG_SYMBOLS = r'^[-a-zA-Z0-9_]+$'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'medium': (960, 960),
+}
+
+IMAGE_QUALITY = 85
+
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_PIXELS = 25000000
+
+IMAGE_WORKERS = 2
+
 USERNAME_SIZE = 150
 
 EMAIL_SIZE = 254
@@ -148,3 +206,49 @@ NAME_SIZE = 200
 COLOR_SIZE = 7
 
 SLUG_SIZE = 200
+
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+
+RECIPE_CACHE_TIMEOUT = 60 * 60
+
+TOKEN_CACHE_SIZE = 10000
+
+TOKEN_CACHE_TTL = 60
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+INGREDIENT_INDEX_TTL = 60 * 5
+
+COOK_INDEX_TTL = 60 * 5
+
+COOK_RESULTS_LIMIT = 50
+
+API_CACHE_MAX_AGE = 60
+
+RECIPE_BATCH_LIMIT = 100
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+PROFILING = {
+    'ENABLED': os.getenv('PROFILING') == 'True',
+    'LOG_FILE': os.getenv(
+        'PROFILING_LOG_FILE', default=os.path.join(BASE_DIR, 'profiling.jsonl')
+    ),
+    'MAX_FILE_SIZE': 10 * 1024 * 1024,
+    'QUERY_BUDGETS': {
+        'GET recipes-list': 10,
+        'GET recipes-detail': 10,
+        'GET subscriptions': 5,
+        'GET users-list': 2,
+        'GET users-detail': 1,
+        'GET ingredients-list': 2,
+        'GET tags-list': 2,
+        'GET recipes-cook': 6,
+        'POST recipes-favorite-batch': 15,
+        'POST recipes-shopping-cart-batch': 15,
+        'DELETE recipes-shopping-cart-batch': 15,
+        'DELETE recipes-clear-shopping-cart': 15,
+    },
+    'DEFAULT_QUERY_BUDGET': None,
+    'FAIL_ON_BUDGET': os.getenv('PROFILING_FAIL_ON_BUDGET') == 'True',
+}
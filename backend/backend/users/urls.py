@@ -2,6 +2,5 @@ from django.urls import include, path
 
 
 urlpatterns = [
-    path('', include('djoser.urls')),
     path(r'auth/', include('djoser.urls.authtoken'))
 ]